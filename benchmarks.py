@@ -0,0 +1,914 @@
+import time
+import tracemalloc
+import json
+import threading
+import traceback
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from termcolor import colored           # prints colored text
+from shapely.geometry import Point, Polygon
+
+from functions import seconds_to_time, meters_to_latitude, nest_polygons, fill_hidden_pixels, composite_ndwi, get_multiple_elevation_opentopodata
+from functions import get_multiple_elevation_coalesced, coalesce_points
+from functions import vertex_block, fsdata_polygons, write_fsdata
+from functions import extract_contours, extract_contours_chunked, search_online_prod, download_products
+from functions import EdgeGeoCoding, tile_contours, nest_segments, water_interior_points, PackedMask
+from functions import ndwi_formula, s2_zip_members, gdal_strip_reader, gdal_geocoding, CompositeState
+from functions.gdal_io import _read_20m
+from functions.raster import _hidden_boxes
+import os
+import sys
+import platform
+import subprocess
+import tempfile
+import hashlib
+import re
+from zipfile import ZipFile
+from glob import iglob
+
+# =============================================================================
+# %% Synthetic polygons
+# =============================================================================
+
+def synthetic_nested_rings(n_lakes, depth=3, n_vertices=40, seed=0):
+    """
+    Create n_lakes groups of concentric rings (lake, island, pond in the island...) placed on a grid.
+    Output : list of segments (np arrays of shape (n_vertices+1, 2), closed) like cset.allsegs[0]
+    """
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(n_lakes)))
+    angles = np.linspace(0, 2*np.pi, n_vertices+1)
+    angles[-1] = 0 # closed ring
+    segments = []
+    for k in range(n_lakes) :
+        cx, cy = 10*(k%side), 10*(k//side)
+        for d in range(depth) :
+            r = 4*(1 - d/depth) * (1 + 0.1*rng.random(n_vertices+1))
+            r[-1] = r[0]
+            segments.append(np.column_stack((cx + r*np.cos(angles), cy + r*np.sin(angles))))
+    return segments
+
+def nest_polygons_bruteforce(polygon_list, point_list):
+    """
+    The former double loop of main-Polygons, kept as a reference for the benchmark.
+    """
+    n_poly = len(polygon_list)
+    islands_of_i = {i:[] for i in range(n_poly)}
+    exclude_water = np.zeros((n_poly,))
+    for i_point in range(n_poly) :
+        point = point_list[i_point]
+        n=0
+        for i_polygon in range(n_poly) :
+            if i_polygon == i_point : continue
+            if polygon_list[i_polygon].contains(point) :
+                n +=1
+                islands_of_i[i_polygon].append(i_point)
+        if n%2 == 1 :
+            exclude_water[i_point] = 1
+    return exclude_water, islands_of_i
+
+def synthetic_cloudy_ndwi(size, hidden_fraction, seed=0):
+    """
+    Create a smooth NDWI-like array of shape (size, size) with random square holes set to 2 (no data).
+    Output : NDWI array, hidden mask
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.ogrid[0:size, 0:size] # broadcast : a 10980² mgrid alone takes 2 GB
+    y, x = y/size, x/size
+    NDWI = np.sin(6*np.pi*x)*np.cos(4*np.pi*y)
+    hidden = np.zeros((size, size), dtype=bool)
+    hole = max(2, size//50)
+    while hidden.mean() < hidden_fraction :
+        r, c = rng.integers(0, size-hole, 2)
+        hidden[r:r+hole, c:c+hole] = True
+    NDWI[hidden] = 2
+    return NDWI, hidden
+
+def synthetic_products(size, n_prod, seed=0):
+    """
+    Create n_prod synthetic products of shape (size, size) : NDWI, cloud confidence and scene classification arrays.
+    Each product misses a band of the tile and has random cloudy squares.
+    """
+    rng = np.random.default_rng(seed)
+    products = []
+    for i in range(n_prod) :
+        NDWI, _ = synthetic_cloudy_ndwi(size, 0, seed+i)
+        NDWI = (NDWI + 0.1*rng.standard_normal((size, size))).astype(np.float32)
+        clouds = np.zeros((size, size), dtype=np.float32)
+        _, cloudy = synthetic_cloudy_ndwi(size, 0.2, seed+i)
+        clouds[cloudy] = rng.uniform(0, 100, cloudy.sum())
+        classification = np.ones((size, size), dtype=np.float32)
+        classification[:, (i*size)//(2*n_prod):(i*size)//(2*n_prod) + size//10] = 0 # not covered by the photography
+        products.append((NDWI, clouds, classification))
+    return products
+
+def _draw_disc(array, r, c, radius, value):
+    """
+    Set value in the disc of center (r, c) of array, only the bounding box of the disc is computed
+    """
+    h, w = array.shape
+    r0, r1 = max(int(r - radius), 0), min(int(r + radius) + 2, h)
+    c0, c1 = max(int(c - radius), 0), min(int(c + radius) + 2, w)
+    if r0 >= r1 or c0 >= c1 : return
+    y, x = np.ogrid[r0:r1, c0:c1]
+    array[r0:r1, c0:c1][(y - r)**2 + (x - c)**2 <= radius**2] = value
+
+def synthetic_tile(size=5490, pixel_m=20, lake_density=0.5, island_depth=2, n_rivers=5, seed=0):
+    """
+    Land and water NDWI-like array of shape (size, size) : land < 0 < water, the scale of a real tile
+    (5490 pixels of 20 m, or 10980 pixels of 10 m).
+    lake_density -- lakes per km2, of random radius (log-normal, median 100 m), with nested islands, ponds in the islands...
+                    down to island_depth levels
+    n_rivers     -- elongated water bodies : random walks of random width crossing the tile
+    Output : NDWI array (float32)
+    """
+    rng = np.random.default_rng(seed)
+    NDWI = np.full((size, size), -0.5, dtype=np.float32)
+    n_lakes = int(lake_density * (size*pixel_m/1000)**2)
+    for r, c, radius in zip(rng.uniform(0, size, n_lakes), rng.uniform(0, size, n_lakes), rng.lognormal(np.log(100/pixel_m), 0.6, n_lakes)) :
+        for d in range(island_depth + 1) :
+            # each level is a disc inside the previous one, of the opposite sign
+            _draw_disc(NDWI, r, c, radius*(1 - d/(island_depth + 1)), 0.5 if d%2 == 0 else -0.5)
+            r += rng.uniform(-0.1, 0.1)*radius/(island_depth + 1)
+            c += rng.uniform(-0.1, 0.1)*radius/(island_depth + 1)
+    for _ in range(n_rivers) :
+        r, c = rng.uniform(0, size), 0.
+        heading, width = rng.uniform(-0.5, 0.5), rng.uniform(1.5, 4)
+        while 0 <= c < size and -size < r < 2*size :
+            _draw_disc(NDWI, r, c, width, 0.5)
+            heading = np.clip(heading + rng.normal(0, 0.1), -1, 1)
+            r, c = r + width*np.sin(heading), c + width*np.cos(heading)
+    NDWI += (0.05*rng.standard_normal((size, size))).astype(np.float32)
+    return NDWI
+
+def synthetic_tile_products(NDWI, n_prod, cloud_fraction=0.2, seed=0):
+    """
+    n_prod products of the tile NDWI, for composite_ndwi : each one misses a band of the tile and has cloudy squares
+    on cloud_fraction of it. Strips are computed when read, only the cloud masks are kept.
+    Output : read_strip(i, y0, n_rows)
+    """
+    size = NDWI.shape[1]
+    cloudy = [synthetic_cloudy_ndwi(size, cloud_fraction, seed+i)[1] if cloud_fraction else np.zeros(NDWI.shape, dtype=bool)
+              for i in range(n_prod)]
+    def read_strip(i, y0, n_rows) :
+        rng = np.random.default_rng((seed, i, y0))
+        NDWI_strip = NDWI[y0:y0+n_rows] + (0.05*rng.standard_normal((n_rows, size))).astype(np.float32)
+        clouds = np.where(cloudy[i][y0:y0+n_rows], 80, 5).astype(np.float32)
+        classification = np.ones((n_rows, size), dtype=np.float32)
+        classification[:, (i*size)//(2*n_prod):(i*size)//(2*n_prod) + size//10] = 0 # not covered by the photography
+        return NDWI_strip, clouds, classification
+    return read_strip
+
+def start_elevation_stub(failure_rate=0.1, latency=0.05, seed=0):
+    """
+    Start a local stand-in of the opentopodata API on a free port, answering elevation = 100 + lat + lon.
+    A fraction failure_rate of the requests gets a 503 to exercise retries.
+    Output : the server (server.shutdown() to stop it, server.n_requests counts the requests), its base url
+    """
+    rng = np.random.default_rng(seed)
+    lock = threading.Lock()
+    class Handler(BaseHTTPRequestHandler) :
+        def do_GET(self) :
+            time.sleep(latency)
+            with lock :
+                server.n_requests += 1
+                fail = rng.random() < failure_rate
+            if fail :
+                self.send_response(503)
+                self.send_header('Retry-After', '0')
+                self.end_headers()
+                return
+            locations = parse_qs(urlparse(self.path).query)['locations'][0].split('|')
+            results = []
+            for location in locations :
+                lat, lon = map(float, location.split(','))
+                results.append({'elevation':100 + lat + lon, 'location':{'lat':lat, 'lng':lon}})
+            body = json.dumps({'status':'OK', 'results':results}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args) :
+            pass
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.n_requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/v1'
+
+def synthetic_search_entries(n_prod, seed=0):
+    """
+    Random products as listed by the OpenSearch API : (title, href, mediumprobacloudpercentage, snowicepercentage)
+    """
+    rng = np.random.default_rng(seed)
+    clouds = rng.uniform(0, 100, n_prod).round(2)
+    snow = np.where(rng.random(n_prod) < 0.3, rng.uniform(0, 10, n_prod), 0).round(2)
+    return [(f'S2A_MSIL2A_2022{i:08d}_N0400_R001_T31TCJ_2022{i:08d}', f'https://stub/odata/v1/Products(\'{i}\')/$value', c, s)
+            for i, (c, s) in enumerate(zip(clouds, snow))]
+
+def start_search_stub(entries, latency=0.1, max_rows=100):
+    """
+    Start a local stand-in of the OpenSearch API of scihub on a free port, paging the given entries (start & rows parameters).
+    Output : the server (server.shutdown() to stop it, server.n_requests counts the requests), its search url
+    """
+    lock = threading.Lock()
+    class Handler(BaseHTTPRequestHandler) :
+        def do_GET(self) :
+            time.sleep(latency)
+            with lock :
+                server.n_requests += 1
+            query = parse_qs(urlparse(self.path).query)
+            start, rows = int(query['start'][0]), min(int(query['rows'][0]), max_rows)
+            lines = ['<?xml version="1.0" encoding="utf-8"?>',
+                     '<feed xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" xmlns="http://www.w3.org/2005/Atom">',
+                     f'<opensearch:totalResults>{len(entries)}</opensearch:totalResults>',
+                     f'<opensearch:startIndex>{start}</opensearch:startIndex>']
+            for title, href, cloud, snow in entries[start:start+rows] :
+                lines += ['<entry>', f'<title>{title}</title>', f'<link href="{href}"/>', f'<link rel="icon" href="{href}/icon"/>',
+                          f'<double name="mediumprobacloudpercentage">{cloud}</double>',
+                          f'<double name="snowicepercentage">{snow}</double>', '</entry>']
+            lines.append('</feed>')
+            body = '\n'.join(lines).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args) :
+            pass
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.n_requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/dhus/search'
+
+def synthetic_zips(folder, n_prod, size=2**22, seed=0):
+    """
+    Write n_prod zips of about size bytes of random data in folder. Output : dict uuid -> content of the zip
+    """
+    rng = np.random.default_rng(seed)
+    files = {}
+    for i in range(n_prod) :
+        path = os.path.join(folder, f'{i}.zip')
+        with ZipFile(path, 'w') as archive :
+            archive.writestr('MTD_MSIL2A.xml', '<n1:Level-2A_User_Product/>')
+            archive.writestr('IMG_DATA/B03.jp2', rng.integers(0, 256, size, dtype=np.uint8).tobytes())
+        with open(path, 'rb') as file :
+            files[f'{i:08x}-uuid'] = file.read()
+    return files
+
+def start_download_stub(files, drop_fraction=0.5, bad_checksums=()):
+    """
+    Start a local stand-in of the OData download API on a free port : Products('uuid')/$value with Range requests,
+    Products('uuid')?$format=json with the MD5 checksum (wrong for the uuids of bad_checksums).
+    The first transfer of each file is cut after drop_fraction of its bytes, to exercise resuming.
+    Output : the server (server.shutdown() to stop it, server.resumed counts the Range requests), its base url
+    """
+    dropped = set()
+    lock = threading.Lock()
+    class Handler(BaseHTTPRequestHandler) :
+        protocol_version = 'HTTP/1.1'
+        def send_body(self, status, body, headers={}) :
+            self.send_response(status)
+            for key, value in headers.items() : self.send_header(key, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def do_GET(self) :
+            match = re.search(r"Products\('([^']+)'\)(/\$value)?", urlparse(self.path).path)
+            if match is None or match.group(1) not in files :
+                return self.send_body(404, b'')
+            uuid, data = match.group(1), files[match.group(1)]
+            if match.group(2) is None :
+                md5 = hashlib.md5(data).hexdigest()
+                if uuid in bad_checksums : md5 = md5[::-1]
+                return self.send_body(200, json.dumps({'d':{'Checksum':{'Algorithm':'MD5', 'Value':md5}}}).encode())
+            start = int(re.match(r'bytes=(\d+)-', self.headers.get('Range', 'bytes=0-')).group(1))
+            if start >= len(data) :
+                return self.send_body(416, b'')
+            with lock :
+                if start : server.resumed += 1
+                drop = uuid not in dropped
+                dropped.add(uuid)
+            self.send_response(206 if start else 200)
+            self.send_header('Content-Length', str(len(data) - start))
+            if start : self.send_header('Content-Range', f'bytes {start}-{len(data)-1}/{len(data)}')
+            self.end_headers()
+            end = start + int(drop_fraction*(len(data) - start)) if drop else len(data)
+            self.wfile.write(data[start:end])
+            if drop : self.close_connection = True
+        def log_message(self, *args) :
+            pass
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.resumed = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/odata/v1'
+
+def fill_hidden_pixels_loop(NDWI_combined, hidden):
+    """
+    The former pixel by pixel infill loop of main-NDWI, kept as a reference for the benchmark.
+    """
+    h, w = NDWI_combined.shape
+    Coordinates_remaining_clouds = np.transpose(np.where(hidden))
+    NDWI_not_set=list(range(len(Coordinates_remaining_clouds)))
+    x_neighbours = [0,+1,0,-1]
+    y_neighbours = [+1,0,-1,0]
+    min_neighbours = 2
+    i1 = 0
+    len0 = len1 = len(NDWI_not_set)
+    while len(NDWI_not_set)>0 :
+        if i1 == len(NDWI_not_set) :
+            i1=0
+            if len0 == len1 :
+                min_neighbours=1
+            len0 = len1
+        x,y = Coordinates_remaining_clouds[NDWI_not_set[i1]]
+        num = div = 0
+        for j in range(4):
+            xn, yn = x+x_neighbours[j], y+y_neighbours[j]
+            if 0 <= xn < h and 0 <= yn < w and NDWI_combined[xn, yn] != 2 :
+                num += NDWI_combined[xn, yn]
+                div += 1
+        if div >= min_neighbours :
+            NDWI_combined[x,y] = num/div
+            NDWI_not_set.pop(i1)
+        else :
+            i1+=1
+        len1 = len(NDWI_not_set)
+    return NDWI_combined
+
+def fill_hidden_pixels_fronts(array, hidden, min_neighbours=2):
+    """
+    Reference of fill_hidden_pixels on whole boxes : at each front, every hidden pixel of the box having at least
+    min_neighbours known 4-neighbours is set to their mean, all at once. Slow, without the sparse front bookkeeping.
+    """
+    h, w = array.shape
+    for r0, r1, c0, c1 in _hidden_boxes(hidden) :
+        r0, r1, c0, c1 = max(r0-1, 0), min(r1+1, h), max(c0-1, 0), min(c1+1, w)
+        box_hidden = np.pad(hidden[r0:r1, c0:c1], 1)
+        known = np.pad(~hidden[r0:r1, c0:c1], 1)
+        values = np.pad(np.where(hidden[r0:r1, c0:c1], 0, array[r0:r1, c0:c1]), 1)
+        box_min = min_neighbours
+        while (box_hidden & ~known).any() :
+            neighbours = [(slice(0, -2), slice(1, -1)), (slice(2, None), slice(1, -1)), (slice(1, -1), slice(0, -2)), (slice(1, -1), slice(2, None))]
+            div = sum(known[n].astype(int) for n in neighbours) # same order as _fill_box : up, down, left, right
+            to_set = box_hidden[1:-1, 1:-1] & ~known[1:-1, 1:-1] & (div >= box_min)
+            if not to_set.any() :
+                if box_min == 1 : break
+                box_min = 1
+                continue
+            total = sum(values[n]*known[n] for n in neighbours)
+            values[1:-1, 1:-1][to_set] = total[to_set]/div[to_set]
+            known[1:-1, 1:-1][to_set] = True
+        filled = (box_hidden & known)[1:-1, 1:-1]
+        array[r0:r1, c0:c1][filled] = values[1:-1, 1:-1][filled]
+    return array
+
+# =============================================================================
+# %% Benchmarks
+# =============================================================================
+
+def bench_nesting(sizes=(250, 500, 1000, 2000, 4000, 8000), bruteforce_max=2000):
+    """
+    Time nest_polygons against the former double loop and check both give the same result.
+    time/(n log n) should stay roughly constant for nest_polygons.
+    """
+    print(colored('Nesting benchmark', 'cyan'))
+    for n in sizes :
+        Segments = synthetic_nested_rings(max(1, n//3))
+        point_list = [Point(seg[len(seg)//2]) for seg in Segments]
+        polygon_list = [Polygon(seg) for seg in Segments]
+        n_poly = len(Segments)
+
+        t0 = time.time()
+        exclude_water, islands_of_i, parent_of_i, children_of_i = nest_polygons(polygon_list, point_list)
+        t_tree = time.time() - t0
+        line = f'\tn = {n_poly:>6} : STR-tree {seconds_to_time(t_tree)}, per n.log(n) {1e6*t_tree/(n_poly*np.log(n_poly)):.2f}µs'
+
+        if n_poly <= bruteforce_max :
+            t0 = time.time()
+            exclude_ref, islands_ref = nest_polygons_bruteforce(polygon_list, point_list)
+            t_brute = time.time() - t0
+            assert (exclude_ref == exclude_water).all() and islands_ref == islands_of_i, "nest_polygons differs from the double loop"
+            line += f', double loop {seconds_to_time(t_brute)}'
+        print(line)
+
+def bench_infill(sizes=(500, 2000, 10980), hidden_fractions=(0.01, 0.05), loop_max=500, n_large_clouds=2, large_cloud=780):
+    """
+    Time fill_hidden_pixels on synthetic cloudy tiles, and the former loop on small ones,
+    then on the largest size with n_large_clouds square clouds of large_cloud pixels.
+    Up to loop_max, each pixel is checked to be the mean of its neighbours known at its front (fill_hidden_pixels_fronts),
+    and the difference to the loop is reported : the loop updates pixels one after another, so that a pixel
+    already uses the pixels set before it in the same pass.
+    """
+    print(colored('Infill benchmark', 'cyan'))
+    for size in sizes :
+        for fraction in hidden_fractions :
+            NDWI, hidden = synthetic_cloudy_ndwi(size, fraction)
+            t0 = time.time()
+            filled, n_fronts = fill_hidden_pixels(NDWI.copy(), hidden)
+            t_vect = time.time() - t0
+            assert not (filled == 2).any(), "fill_hidden_pixels left hidden pixels"
+            line = f'\t{size}x{size}, hidden {100*hidden.mean():.1f}% : vectorized {seconds_to_time(t_vect)} ({n_fronts} fronts)'
+            if size <= loop_max :
+                reference = fill_hidden_pixels_fronts(NDWI.copy(), hidden)
+                assert np.array_equal(filled, reference), "fill_hidden_pixels differs from the mean of the neighbours known at each front"
+                t0 = time.time()
+                loop = fill_hidden_pixels_loop(NDWI.copy(), hidden)
+                difference = np.abs(filled - loop)[hidden]
+                line += f', former loop {seconds_to_time(time.time() - t0)}, difference to the loop max {difference.max():.2f} mean {difference.mean():.3f}'
+            print(line)
+    # few large clouds : hundreds of fronts on a full size tile
+    size = max(sizes)
+    NDWI, _ = synthetic_cloudy_ndwi(size, 0)
+    hidden = np.zeros((size, size), dtype=bool)
+    for k in range(n_large_clouds) :
+        r0 = (2*k+1)*size//(2*n_large_clouds) - large_cloud//2
+        hidden[r0:r0+large_cloud, r0:r0+large_cloud] = True
+    NDWI[hidden] = 2
+    t0 = time.time()
+    filled, n_fronts = fill_hidden_pixels(NDWI, hidden)
+    assert not (filled == 2).any(), "fill_hidden_pixels left hidden pixels"
+    print(f'\t{size}x{size}, {n_large_clouds} clouds of {large_cloud} px, hidden {100*hidden.mean():.1f}% : '
+          f'vectorized {seconds_to_time(time.time()-t0)} ({n_fronts} fronts)')
+
+def bench_compositing(size=4000, n_prod=6, strip_heights=(None, 2048, 512)):
+    """
+    Time composite_ndwi and its peak traced memory for full-tile and strip reads, and check the results are identical.
+    """
+    print(colored('Compositing benchmark', 'cyan'))
+    products = synthetic_products(size, n_prod)
+    def read_strip(i, y0, n_rows) :
+        return [band[y0:y0+n_rows].copy() for band in products[i]] # copy like a readPixels would
+    reference = None
+    for strip_h in strip_heights :
+        tracemalloc.start()
+        t0 = time.time()
+        result = composite_ndwi(read_strip, n_prod, size, size, strip_h=strip_h)
+        t_comp = time.time() - t0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if reference is None : reference = result
+        assert all(np.array_equal(np.asarray(a), np.asarray(b)) for a, b in zip(reference, result)), "strip compositing differs from full tile"
+        print(f'\t{size}x{size}, {n_prod} products, strips of {strip_h or size} rows : {seconds_to_time(t_comp)}, peak {peak/2**20:.0f} MB')
+
+    # incremental : all products folded in, saved and loaded back, then the last one subtracted
+    folder = tempfile.mkdtemp()
+    state = CompositeState(size, size)
+    for i in range(n_prod) :
+        state.fold(read_strip, i, f'product{i}.zip', strip_h=strip_heights[-1], version=(1.5e9 + i, 2**30 + i))
+    state.save(folder)
+    state = CompositeState.load(folder)
+    assert state.versions == {f'product{i}.zip':[1.5e9 + i, 2**30 + i] for i in range(n_prod)}, "product versions not saved"
+    t0 = time.time()
+    state.fold(read_strip, n_prod-1, f'product{n_prod-1}.zip', sign=-1, strip_h=strip_heights[-1])
+    t_remove = time.time() - t0
+    expected = composite_ndwi(read_strip, n_prod-1, size, size, strip_h=strip_heights[-1])
+    result = state.result()
+    difference = np.abs(result[0] - expected[0]).max() # float32 sums : rounding residues of the subtraction
+    assert difference < 1e-3 and result[2] == expected[2] and result[3] == expected[3], "incremental compositing differs"
+    assert f'product{n_prod-1}.zip' not in state.versions, "version of a removed product kept"
+    print(f'\tincremental : product removed in {seconds_to_time(t_remove)}, same coverage and hidden zone as {n_prod-1} products, '
+          f'NDWI within {difference:.0e}')
+
+class ArrayDataset :
+    """
+    Array with the part of the GDAL dataset API _read_20m uses, to check the upsampling without GDAL
+    """
+    def __init__(self, array) :
+        self.array = array
+        self.RasterYSize, self.RasterXSize = array.shape
+    def GetRasterBand(self, k) :
+        return self
+    def ReadAsArray(self, x, y, w, h) :
+        return self.array[y:y+h, x:x+w].copy()
+
+def bandmaths_ndwi(B3, B8):
+    """
+    The BandMaths expression of main-NDWI evaluated pixel by pixel in float32, as SNAP does
+    """
+    def pixel(b3, b8) :
+        if b3 <= 0 and b8 <= 0 : return np.float32(1)
+        b3, b8 = max(np.float32(0), b3), max(np.float32(0), b8)
+        return (b3 - b8)/(b3 + b8)
+    return np.array([pixel(b3, b8) for b3, b8 in zip(B3.ravel(), B8.ravel())], dtype=np.float32).reshape(B3.shape)
+
+def check_gdal_engine(size=301, strip_h=64):
+    """
+    Checks of the parts of the gdal engine that don't need GDAL : ndwi_formula against the BandMaths expression,
+    the 20 m nearest neighbour upsampling of strips against the whole raster repeated twice, and the BOA offsets
+    and quantification read from the MTD xml of a processing baseline 04.00 zip
+    """
+    print(colored('GDAL engine checks', 'cyan'))
+    rng = np.random.default_rng(0)
+    edge = np.array([0, -1, 1, -1000, 1000, 1e-6, 65535], dtype=np.float32)
+    B3 = np.concatenate((np.repeat(edge, len(edge)), rng.uniform(-0.2, 1.5, 10000).astype(np.float32)))
+    B8 = np.concatenate((np.tile(edge, len(edge)), rng.uniform(-0.2, 1.5, 10000).astype(np.float32)))
+    difference = np.abs(ndwi_formula(B3, B8) - bandmaths_ndwi(B3, B8)).max()
+    assert difference <= 1e-7, "ndwi_formula differs from the BandMaths expression"
+    print(f'	ndwi_formula : {len(B3)} pixels, {len(edge)**2} edge cases, max difference with BandMaths {difference:.1e}')
+
+    raster_20m = rng.integers(0, 100, ((size+1)//2, (size+1)//2)).astype(np.float32)
+    reference = np.repeat(np.repeat(raster_20m, 2, axis=0), 2, axis=1)[:size, :size] # 10 m pixel (r, c) in 20 m pixel (r//2, c//2)
+    for start in (0, 1, strip_h - 1) :
+        strips = [_read_20m(ArrayDataset(raster_20m), y0, min(strip_h, size-y0), size) for y0 in range(start, size, strip_h)]
+        assert np.array_equal(np.concatenate(strips), reference[start:]), "20 m strips misaligned"
+    print(f'	20 m upsampling : strips of {strip_h} rows from rows 0, 1 and {strip_h-1} of a {size}x{size} tile equal the whole raster')
+
+    folder = tempfile.mkdtemp()
+    zip_path = os.path.join(folder, 'S2A_MSIL2A_20230701T170851_N0509_R112_T14UPF_20230701T222310.zip')
+    offsets = ''.join(f'<BOA_ADD_OFFSET band_id="{k}">{-1000 - k}</BOA_ADD_OFFSET>' for k in range(13))
+    mtd = (f'<n1:Level-2A_User_Product xmlns:n1="https://psd-14.sentinel2.eo.esa.int/PSD/User_Product_Level-2A.xsd">'
+           f'<General_Info><Product_Image_Characteristics><QUANTIFICATION_VALUES_LIST>'
+           f'<BOA_QUANTIFICATION_VALUE unit="none">10000</BOA_QUANTIFICATION_VALUE></QUANTIFICATION_VALUES_LIST>'
+           f'<BOA_ADD_OFFSET_VALUES_LIST>{offsets}</BOA_ADD_OFFSET_VALUES_LIST>'
+           f'</Product_Image_Characteristics></General_Info></n1:Level-2A_User_Product>')
+    safe = 'S2A_MSIL2A_20230701T170851_N0509_R112_T14UPF_20230701T222310.SAFE'
+    with ZipFile(zip_path, 'w') as archive :
+        archive.writestr(f'{safe}/MTD_MSIL2A.xml', mtd)
+        for suffix in ('R10m/T14UPF_B03_10m.jp2', 'R10m/T14UPF_B08_10m.jp2', 'QI_DATA/MSK_CLDPRB_20m.jp2', 'R20m/T14UPF_SCL_20m.jp2') :
+            archive.writestr(f'{safe}/GRANULE/L2A/{suffix}', b'')
+    members = s2_zip_members(zip_path)
+    assert (members['scale'], members['offset_B3'], members['offset_B8']) == (10000, -1002, -1007), "wrong BOA offsets"
+    print(f"	BOA offsets : B3 {members['offset_B3']:.0f} (band_id 2), B8 {members['offset_B8']:.0f} (band_id 7), scale {members['scale']:.0f}")
+    os.remove(zip_path)
+
+def compare_gdal_snap(zip_path, strip_h=1024, n_strips=3):
+    """
+    Compare the gdal engine with the SNAP path of main-NDWI on a real Sentinel-2 L2A zip (needs GDAL and snappy) :
+    NDWI, cloud confidence and classification of n_strips strips spread over the tile (Resample on B2 then BandMaths),
+    and gdal_geocoding against the EdgeGeoCoding and corners of createGeoBoundary, in meters
+    """
+    import snappy
+    import jpy
+    print(colored('GDAL engine against SNAP', 'cyan'), os.path.basename(zip_path))
+    product = snappy.ProductIO.readProduct(zip_path)
+    parameters = snappy.HashMap()
+    parameters.put('referenceBand', 'B2')
+    resampled = snappy.GPF.createProduct('Resample', parameters, product)
+    BandDescriptor = jpy.get_type('org.esa.snap.core.gpf.common.BandMathsOp$BandDescriptor')
+    band = BandDescriptor()
+    band.name, band.type = 'NDWI', 'float32'
+    band.expression = 'if (B3<=0 and B8<=0) then 1 else (max(0,B3) - max(0,B8))/(max(0,B3) + max(0,B8))' # as main-NDWI
+    bands = jpy.array('org.esa.snap.core.gpf.common.BandMathsOp$BandDescriptor', 1)
+    bands[0] = band
+    parameters = snappy.HashMap()
+    parameters.put('targetBands', bands)
+    ndwi_product = snappy.GPF.createProduct('BandMaths', parameters, resampled)
+    snap_bands = [ndwi_product.getBand('NDWI'), resampled.getBand('quality_cloud_confidence'), resampled.getBand('quality_scene_classification')]
+
+    read_strip, w, h = gdal_strip_reader([zip_path])
+    assert (w, h) == (snap_bands[0].getRasterWidth(), snap_bands[0].getRasterHeight()), "different tile sizes"
+    differences = np.zeros(3)
+    for y0 in np.linspace(0, h - strip_h, n_strips).astype(int) :
+        for k, (gdal_data, snap_band) in enumerate(zip(read_strip(0, y0, strip_h), snap_bands)) :
+            snap_data = np.zeros(w*strip_h, np.float32)
+            snap_band.readPixels(0, int(y0), w, strip_h, snap_data)
+            differences[k] = max(differences[k], np.abs(gdal_data - snap_data.reshape(strip_h, w)).max())
+    print(f'	{n_strips} strips of {strip_h} rows : max difference NDWI {differences[0]:.1e}, clouds {differences[1]:.0f}, classification {differences[2]:.0f}')
+
+    geocoding, corners = gdal_geocoding(zip_path, h//10)
+    snap_geocoding = EdgeGeoCoding.from_boundary(snappy.ProductUtils.createGeoBoundary(product, 1), w, h)
+    snap_corners = np.array([(x.lon, x.lat) for x in list(snappy.ProductUtils.createGeoBoundary(product, h//10))])
+    lat = np.radians(snap_geocoding.y_top.mean())
+    edges_m = max(np.abs(geocoding.x_left - snap_geocoding.x_left).max()*np.cos(lat), np.abs(geocoding.x_right - snap_geocoding.x_right).max()*np.cos(lat),
+                  np.abs(geocoding.y_top - snap_geocoding.y_top).max(), np.abs(geocoding.y_bottom - snap_geocoding.y_bottom).max())/meters_to_latitude(1)
+    print(f'	geocoding : edges at most {edges_m:.2f} m from SNAP, {len(corners)} corners ({len(snap_corners)} with SNAP)')
+    assert differences[0] <= 1e-6 and differences[1] == 0 and differences[2] == 0, "gdal engine rasters differ from SNAP"
+    assert edges_m <= 1 and len(corners) == len(snap_corners), "gdal geocoding differs from SNAP"
+    assert np.abs(corners - snap_corners).max()/meters_to_latitude(1) <= 1, "gdal corners differ from SNAP"
+    product.dispose()
+
+def bench_elevation(n_points=5000, workers=(1, 4, 8), rate=50):
+    """
+    Time get_multiple_elevation_opentopodata against the local stub, with flaky responses, for several numbers of workers.
+    """
+    print(colored('Elevation client benchmark', 'cyan'))
+    server, url = start_elevation_stub()
+    lat_lon = np.random.default_rng(0).uniform((50, -100), (60, -90), (n_points, 2))
+    for n_workers in workers :
+        t0 = time.time()
+        elevations = get_multiple_elevation_opentopodata(lat_lon, url=url, n_workers=n_workers, rate=rate, max_retries=8)
+        assert np.allclose(elevations, 100 + lat_lon.sum(axis=1)), "wrong elevations"
+        print(f'\t{n_points} points, {n_workers} workers, {rate} requests/s : {seconds_to_time(time.time()-t0)}')
+    server.shutdown()
+
+def bench_xml(n_lakes=20000, n_vertices=200):
+    """
+    Time the vertex formatting against the former per-vertex f-strings (same text expected),
+    and the streaming write of a whole FSData file.
+    """
+    print(colored('XML writing benchmark', 'cyan'))
+    Segments = synthetic_nested_rings(n_lakes//3, n_vertices=n_vertices)
+    t0 = time.time()
+    former = [''.join(f'\t\t<Vertex lat="{lat}" lon="{lon}"/>\n' for lon, lat in seg[:-1]) for seg in Segments]
+    t_former = time.time() - t0
+    t0 = time.time()
+    blocks = [vertex_block(seg) for seg in Segments]
+    t_block = time.time() - t0
+    assert blocks == former, "vertex_block differs from the former formatting"
+    print(f'\t{len(Segments)} polygons of {n_vertices} vertices : per-vertex f-strings {seconds_to_time(t_former)}, vertex_block {seconds_to_time(t_block)}')
+
+    exclude_water = np.arange(len(Segments))%2
+    path = os.path.join(tempfile.mkdtemp(), 'bench.xml')
+    tracemalloc.start()
+    t0 = time.time()
+    write_fsdata(path, fsdata_polygons(Segments, exclude_water, np.zeros(len(Segments)), Segments[0]))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f'\tstreaming write : {seconds_to_time(time.time()-t0)}, {os.path.getsize(path)/2**20:.0f} MB written, peak {peak/2**20:.1f} MB')
+    os.remove(path)
+
+def ring_areas(rings):
+    """
+    Sorted shoelace areas of rings, to compare contours whose rings start at different vertices
+    (vertices taken relative to the first one, the products of coordinates of a 10980² tile losing the area of small rings)
+    """
+    rings = [r - r[0] for r in rings]
+    return np.sort([0.5*np.dot(r[:-1,0], r[1:,1]) - 0.5*np.dot(r[1:,0], r[:-1,1]) for r in rings])
+
+def bench_contours(size=6000, block_size=1024, workers=(2, 4, 8)):
+    """
+    Time extract_contours on a whole synthetic tile and extract_contours_chunked, and check they give the same rings
+    """
+    print(colored('Contouring benchmark', 'cyan'))
+    NDWI, _ = synthetic_cloudy_ndwi(size, 0)
+    NDWI += 0.3*np.random.default_rng(0).standard_normal(NDWI.shape)
+    NDWI[0], NDWI[-1], NDWI[:, 0], NDWI[:, -1] = -1, -1, -1, -1 # ring of earth, as main-Polygons
+    t0 = time.time()
+    whole = ring_areas(extract_contours(NDWI)[0]) # only the areas are kept, millions of rings would be copied in the forked workers
+    print(f'\t{size}x{size} : whole array {seconds_to_time(time.time()-t0)}, {len(whole)} rings')
+    t0 = time.time()
+    former = ring_areas(extract_contours(NDWI, algorithm='mpl2014')[0]) # algorithm of the former plt.contour
+    assert len(former) == len(whole) and np.allclose(former, whole), "serial and mpl2014 contours differ"
+    print(f'\t{size}x{size} : mpl2014 {seconds_to_time(time.time()-t0)}, same rings')
+    for n_workers in workers :
+        t0 = time.time()
+        chunked = ring_areas(extract_contours_chunked(NDWI, block_size=block_size, n_workers=n_workers)[0])
+        t_chunk = time.time() - t0
+        assert len(chunked) == len(whole) and np.allclose(chunked, whole), "chunked contours differ"
+        print(f'\t{size}x{size} : blocks of {block_size}, {n_workers} workers {seconds_to_time(t_chunk)}')
+
+def bench_search(n_prod=2000, workers=(1, 4, 8), max_cloudcoverpercentage=20):
+    """
+    Time search_online_prod against the local stub for several numbers of workers, then a cached search
+    """
+    print(colored('Product search benchmark', 'cyan'))
+    entries = synthetic_search_entries(n_prod)
+    expected = {title:href for title, href, cloud, snow in entries if snow == 0 and cloud <= max_cloudcoverpercentage}
+    server, url = start_search_stub(entries)
+    for n_workers in workers :
+        t0 = time.time()
+        selected = search_online_prod(url=url, n_workers=n_workers, cache_ttl=0, max_cloudcoverpercentage=max_cloudcoverpercentage)
+        assert selected == expected, "wrong products selected"
+        print(f'\t{n_prod} products, {n_workers} workers : {seconds_to_time(time.time()-t0)}, {len(selected)} selected')
+    n_requests = server.n_requests
+    t0 = time.time()
+    selected = search_online_prod(url=url, max_cloudcoverpercentage=2*max_cloudcoverpercentage)
+    assert server.n_requests == n_requests, "cached search was requested again"
+    print(f'\tcached search, other cloud threshold : {seconds_to_time(time.time()-t0)}, {len(selected)} selected')
+    server.shutdown()
+
+def bench_download(n_prod=6, size=2**23, workers=(1, 3), max_bytes_per_s=2**24):
+    """
+    Time download_products against the local stub, every transfer being cut once and resumed, then with a bandwidth cap.
+    The product with a wrong checksum must fail and leave nothing in the output folder.
+    """
+    print(colored('Download manager benchmark', 'cyan'))
+    with tempfile.TemporaryDirectory() as folder :
+        files = synthetic_zips(folder, n_prod, size)
+        bad = next(iter(files))
+        for n_workers, cap in [(n, None) for n in workers] + [(max(workers), max_bytes_per_s)] :
+            server, url = start_download_stub(files, bad_checksums=(bad,))
+            products = {uuid:f"{url}/Products('{uuid}')/$value" for uuid in files}
+            output_folder = os.path.join(folder, f'Original_{n_workers}_{cap}')
+            t0 = time.time()
+            results = download_products(products, output_folder, n_workers, 'bench', 'bench', max_bytes_per_s=cap)
+            t_download = time.time() - t0
+            assert isinstance(results[bad], Exception), "wrong checksum not detected"
+            assert sorted(os.listdir(output_folder)) == sorted(f'{uuid}.zip' for uuid in files if uuid != bad), "partial files left"
+            for uuid, path in results.items() :
+                if uuid == bad : continue
+                with open(path, 'rb') as file :
+                    assert file.read() == files[uuid], "downloaded zip differs"
+            total = sum(len(files[uuid]) for uuid in files if uuid != bad)
+            print(f'\t{n_prod} zips of {size/2**20:.0f} MB, {n_workers} workers, cap {cap and cap/2**20} MB/s : '
+                  f'{seconds_to_time(t_download)}, {total/2**20/t_download:.0f} MB/s, {server.resumed} resumed')
+            server.shutdown()
+
+def measure(stage, record, function, *args, **kwargs):
+    """
+    Call function, record its duration and peak traced memory in record[stage]. Output : its result
+    """
+    tracemalloc.start()
+    t0 = time.time()
+    result = function(*args, **kwargs)
+    record[stage] = {'seconds':time.time() - t0, 'peak_mb':tracemalloc.get_traced_memory()[1]/2**20}
+    tracemalloc.stop()
+    print(f'\t\t{stage} : {seconds_to_time(record[stage]["seconds"])}, peak {record[stage]["peak_mb"]:.0f} MB')
+    return result
+
+TILE_SCENARIOS = {
+    'reference'     : {},
+    'lake_dense'    : {'lake_density':3},
+    'deep_islands'  : {'island_depth':5},
+    'rivers'        : {'n_rivers':40, 'lake_density':0.1},
+    'cloudy'        : {'cloud_fraction':0.6},
+    'many_products' : {'n_prod':12},
+    'full_10m_tile' : {'size':10980, 'pixel_m':10},
+    }
+
+def bench_tile(size=5490, pixel_m=20, lake_density=0.5, island_depth=2, n_rivers=5, cloud_fraction=0.2, n_prod=4,
+               strip_h=1024, contour_workers=None, elevation_workers=8, seed=0):
+    """
+    Run the stages of main-NDWI (compositing, infill) and main-Polygons (contouring, nesting, elevation against
+    the local stub, XML writing) on a synthetic tile. Output : dict of the parameters, counts and stage measures
+    """
+    record = {'parameters':{key:value for key, value in locals().items()}, 'counts':{}, 'stages':{}}
+    stages, counts = record['stages'], record['counts']
+    NDWI = synthetic_tile(size, pixel_m, lake_density, island_depth, n_rivers, seed)
+    read_strip = synthetic_tile_products(NDWI, n_prod, cloud_fraction, seed)
+    del NDWI
+
+    NDWI_combined, _, Hidden_zone, _ = measure('compositing', stages, composite_ndwi, read_strip, n_prod, size, size, strip_h=strip_h)
+    counts['hidden_pixels'] = Hidden_zone.count()
+    Hidden_zone = Hidden_zone.to_bool()
+    NDWI_combined[Hidden_zone] = 2
+    _, counts['infill_fronts'] = measure('infill', stages, fill_hidden_pixels, NDWI_combined, Hidden_zone)
+    del Hidden_zone
+
+    lon0, lat0 = -100, 55
+    extent = meters_to_latitude(size*pixel_m)
+    geocoding = EdgeGeoCoding([lon0]*size, [lon0 + extent/np.cos(np.radians(lat0))]*size, [lat0]*size, [lat0 - extent]*size)
+    Segments = measure('contouring', stages, tile_contours, NDWI_combined, geocoding, 0, contour_workers)
+    del NDWI_combined
+    Segments, exclude_water, _, _, children_of_i = measure('nesting', stages, nest_segments, Segments)
+    counts['polygons'] = len(Segments)
+    counts['vertices'] = sum(len(seg) for seg in Segments)
+
+    server, url = start_elevation_stub(failure_rate=0.01, latency=0.01)
+    def altitudes() :
+        elevation_points = water_interior_points(Segments, exclude_water, children_of_i)
+        return get_multiple_elevation_opentopodata(elevation_points, url=url, n_workers=elevation_workers, rate=1000)
+    altitude_list = measure('elevation', stages, altitudes)
+    server.shutdown()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.xml')
+    measure('xml', stages, write_fsdata, path, fsdata_polygons(Segments, exclude_water, altitude_list, Segments[0]))
+    counts['xml_mb'] = os.path.getsize(path)/2**20
+    os.remove(path)
+    return record
+
+def bench_tiles(scenarios=TILE_SCENARIOS, output='bench_results.jsonl', **common):
+    """
+    Run bench_tile for each scenario (parameters overriding the defaults and common) and append the records to the
+    json lines file output, with the date, commit and machine, so that runs can be compared with compare_bench.
+    A scenario raising is recorded with its error and the next ones still run, the failures are raised at the end.
+    """
+    print(colored('Synthetic tile benchmark', 'cyan'))
+    try :
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError :
+        commit = None
+    run = {'date':time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit':commit, 'machine':platform.node(),
+           'python':platform.python_version(), 'cpu_count':os.cpu_count()}
+    records = []
+    for name, parameters in scenarios.items() :
+        print(f'\t{name} :')
+        try :
+            record = {'scenario':name, **run, **bench_tile(**{**common, **parameters})}
+        except Exception as e : # the other scenarios still run
+            traceback.print_exc()
+            record = {'scenario':name, **run, 'error':repr(e)}
+        records.append(record)
+        with open(output, 'a') as file :
+            file.write(json.dumps(record) + '\n')
+    failed = [record['scenario'] for record in records if 'error' in record]
+    assert not failed, f"scenarios failed : {', '.join(failed)}"
+    return records
+
+def compare_bench(path='bench_results.jsonl', threshold=1.2):
+    """
+    Compare the last record of each scenario of path with the previous one, stages slower than threshold times are shown in red
+    """
+    with open(path) as file :
+        records = [json.loads(line) for line in file]
+    for name in dict.fromkeys(record['scenario'] for record in records) :
+        runs = [record for record in records if record['scenario'] == name and 'error' not in record]
+        if len(runs) < 2 : continue
+        previous, last = runs[-2], runs[-1]
+        print(colored(f'{name} : {previous["commit"]} -> {last["commit"]}', 'cyan'))
+        for stage, measures in last['stages'].items() :
+            if stage not in previous['stages'] : continue
+            ratio = measures['seconds']/max(previous['stages'][stage]['seconds'], 1e-9)
+            mem_ratio = measures['peak_mb']/max(previous['stages'][stage]['peak_mb'], 1e-9)
+            text = f'\t{stage} : time x{ratio:.2f}, peak memory x{mem_ratio:.2f}'
+            print(colored(text, 'red') if max(ratio, mem_ratio) > threshold else text)
+
+def bench_cold_start(target=0.15, repeats=5):
+    """
+    Time fresh interpreters importing the functions package and starting its command line (best of repeats),
+    and check that the light entry points import none of the heavy dependencies.
+    """
+    print(colored('Cold start benchmark', 'cyan'))
+    heavy = ('numpy', 'matplotlib', 'pandas', 'requests', 'shapely', 'snappy')
+    check = f"; import sys; assert not [m for m in {heavy} if m in sys.modules], 'heavy module imported'"
+    entry_points = {
+        'python' : ['-c', 'pass'],
+        'import functions' : ['-c', 'import functions' + check],
+        'seconds_to_time' : ['-c', 'from functions import seconds_to_time, profiler' + check],
+        'cli --help' : ['-c', 'import sys; sys.argv = ["functions", "--help"]\ntry :\n from functions.cli import main; main()\nexcept SystemExit : pass' + check],
+        'process_polygons_tile' : ['-c', 'from functions import process_polygons_tile'],
+        }
+    for name, arguments in entry_points.items() :
+        durations = []
+        for _ in range(repeats) :
+            t0 = time.time()
+            subprocess.run([sys.executable] + arguments, check=True, stdout=subprocess.DEVNULL)
+            durations.append(time.time() - t0)
+        text = f'\t{name} : {seconds_to_time(min(durations), 3)}'
+        print(colored(text, 'red') if name in ('seconds_to_time', 'cli --help') and min(durations) > target else text)
+
+def bench_masks(size=10980, n_prod=6, cloud_fraction=0.2):
+    """
+    Memory and time of the coverage and hidden-zone accounting of n_prod products : int64 masks of the former main-NDWI,
+    bool arrays and PackedMask (same counts expected)
+    """
+    print(colored('Packed masks benchmark', 'cyan'))
+    masks = [synthetic_cloudy_ndwi(size, cloud_fraction, seed)[1] for seed in range(n_prod)]
+    t0 = time.time()
+    hidden = np.ones((size, size), dtype=np.int64)
+    for mask in masks :
+        hidden = hidden * (mask*1)
+    n_int64 = int(np.sum(hidden))
+    t_int64 = time.time() - t0
+    t0 = time.time()
+    hidden = np.ones((size, size), dtype=bool)
+    for mask in masks :
+        hidden &= mask
+    n_bool = int(np.sum(hidden))
+    t_bool = time.time() - t0
+    packed_masks = [PackedMask.from_bool(mask) for mask in masks]
+    t0 = time.time()
+    packed = PackedMask.ones((size, size))
+    for mask in packed_masks :
+        packed &= mask
+    n_packed = packed.count()
+    t_packed = time.time() - t0
+    assert n_int64 == n_bool == n_packed, "masks counts differ"
+    print(f'\t{size}x{size}, {n_prod} masks, {n_packed} pixels hidden in all : int64 {seconds_to_time(t_int64)} {size**2*8/2**20:.0f} MB/mask, '
+          f'bool {seconds_to_time(t_bool)} {size**2/2**20:.0f} MB/mask, packed {seconds_to_time(t_packed)} {packed.nbytes/2**20:.1f} MB/mask')
+
+def synthetic_pond_clusters(n_clusters, ponds_per_cluster=10, spread_m=20, seed=0):
+    """
+    Sample points of ponds in clusters, as on lake-dense northern tiles : array of shape (n, 2), latitude, longitude
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform((54, -100), (55, -99), (n_clusters, 2))
+    offsets = rng.normal(0, meters_to_latitude(spread_m), (n_clusters*ponds_per_cluster, 2))
+    return np.repeat(centers, ponds_per_cluster, axis=0) + offsets
+
+def bench_coalescing(n_clusters=1000, radii=(None, 25, 50, 100), workers=8, rate=50):
+    """
+    Requests sent to the local stub with and without coalescing of the sample points, and how far the sample points
+    were moved to the representative of their group (at most radius_m)
+    """
+    print(colored('Elevation coalescing benchmark', 'cyan'))
+    lat_lon = synthetic_pond_clusters(n_clusters)
+    expected = 100 + lat_lon.sum(axis=1)
+    for radius_m in radii :
+        server, url = start_elevation_stub(failure_rate=0)
+        t0 = time.time()
+        if radius_m is None :
+            elevations = get_multiple_elevation_opentopodata(lat_lon, url=url, n_workers=workers, rate=rate)
+        else :
+            elevations, stats = get_multiple_elevation_coalesced(lat_lon, radius_m, url=url, n_workers=workers, rate=rate)
+            assert stats['requests_saved'] == -(-len(lat_lon)//100) - server.n_requests, "wrong requests saved"
+        if radius_m is None :
+            displacement_m = np.abs(elevations - expected).max()/meters_to_latitude(1)
+        else :
+            representatives, group_of_point = coalesce_points(lat_lon, radius_m)
+            scale = np.array([1, np.cos(np.radians(lat_lon[:,0].mean()))])
+            displacement_m = np.sqrt((((lat_lon - representatives[group_of_point])*scale)**2).sum(axis=1)).max()/meters_to_latitude(1)
+            assert displacement_m <= radius_m*(1 + 1e-9), "point farther than radius_m from its representative"
+        print(f'\t{len(lat_lon)} points, radius {radius_m} m : {server.n_requests} requests, {seconds_to_time(time.time()-t0)}, '
+              f'points moved by {displacement_m:.0f} m at most')
+        server.shutdown()
+
+if __name__ == '__main__' :
+    bench_nesting()
+    bench_infill()
+    bench_compositing()
+    check_gdal_engine()
+    zips = sorted(iglob(os.path.join('Original', '*MSIL2A*.zip')))
+    if zips : compare_gdal_snap(zips[0]) # needs GDAL, snappy and a product in Original
+    bench_masks()
+    bench_elevation()
+    bench_coalescing()
+    bench_xml()
+    bench_contours()
+    bench_search()
+    bench_download()
+    bench_cold_start()
+    bench_tiles()
+    compare_bench()
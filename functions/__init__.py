@@ -0,0 +1,42 @@
+"""
+Helpers of main-NDWI, main-Polygons and main-Mosaic, in submodules imported on first use :
+`from functions import seconds_to_time` only imports functions.general, numpy, shapely, matplotlib, requests
+and snappy are imported when a helper needing them is.
+`python -m functions <command>` runs the stages from the command line (functions/cli.py).
+"""
+import importlib
+
+_exports = {
+    'general'   : ['seconds_to_time', 'meters_to_latitude', 'Profiler', 'profiler', 'read_profile', 'write_chrome_trace'],
+    'plotting'  : ['land_water_cmap', 'output_view', 'output_RGB'],
+    'geometry'  : ['nest_polygons', 'EdgeGeoCoding', 'simplify_segments', 'water_interior_points'],
+    'masks'     : ['PackedMask'],
+    'raster'    : ['extract_contours', 'extract_contours_chunked', 'fill_hidden_pixels', 'composite_ndwi', 'CompositeState', 'ndwi_formula'],
+    'gdal_io'   : ['s2_zip_members', 'gdal_strip_reader', 'gdal_geocoding'],
+    'products'  : ['read_zip_name', 'read_mtd_metadata', 'ProductCatalog'],
+    'scihub'    : ['search_online_prod', 'product_checksum', 'download_product', 'scihub_credentials', 'download_products'],
+    'elevation' : ['TokenBucket', 'http_session', 'get_with_retry', 'get_json_with_retry', 'ElevationCache', 'get_elevation_openelevation',
+                   'get_elevation_opentopodata', 'get_multiple_elevation_opentopodata', 'coalesce_points',
+                   'get_multiple_elevation_coalesced', 'DemIndex', 'get_multiple_elevation_dem'],
+    'fsdata'    : ['vertex_block', 'fsdata_polygons', 'write_fsdata', 'lines_water_polygon', 'lines_exclude_water_polygon'],
+    'snap_io'   : ['read_ndwi_dim'],
+    'pipeline'  : ['write_ndwi_npy', 'read_ndwi_npy', 'read_ndwi', 'tile_contours', 'nest_segments', 'tile_altitudes', 'process_polygons_tile'],
+    'mosaic'    : ['read_fsdata', 'read_main_exclusion', 'fsdata_water_areas', 'mosaic_fsdata'],
+    'batch'     : ['run_tiles', 'up_to_date'],
+    }
+_submodule_of = {name:module for module, names in _exports.items() for name in names}
+
+__all__ = sorted(_submodule_of)
+
+def __getattr__(name):
+    """
+    Import the submodule of name on first access, the name is then a global of the package
+    """
+    if name not in _submodule_of :
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{_submodule_of[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,97 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from termcolor import colored
+
+from .general import seconds_to_time
+
+# =============================================================================
+# %% Workers
+# =============================================================================
+
+_started = None # queue receiving the tiles started by the worker, to know which ones were running when a pool breaks
+
+def warm_worker(warm_snap=True, started=None) :
+    """
+    Run once in each worker : imports and the snappy JVM are then kept warm for all the tiles of the worker.
+    The JVM is not needed when all tiles have their NDWI/<tile>.npy
+    """
+    global _started
+    _started = started
+    from . import pipeline
+    if warm_snap :
+        import snappy
+
+def run_tile(tile, settings) :
+    from .pipeline import process_polygons_tile
+    if _started is not None :
+        _started.put(tile) # SimpleQueue : written before the tile starts, even if the worker dies right after
+    return process_polygons_tile(tile, **settings)
+
+def up_to_date(tile, product_path='NDWI', output_folder='Output') :
+    """
+    True if Output/<tile>.xml is newer than NDWI/<tile>.dim and NDWI/<tile>.npy.
+    False if the tile has none of them : it is processed, and fails alone in run_tiles
+    """
+    output = os.path.join(output_folder, f'{tile}.xml')
+    inputs = [os.path.join(product_path, f'{tile}{ext}') for ext in ('.dim', '.npy')]
+    input_times = [os.path.getmtime(i) for i in inputs if os.path.exists(i)]
+    if not input_times or not os.path.exists(output) :
+        return False
+    return os.path.getmtime(output) >= max(input_times)
+
+# =============================================================================
+# %% Batch
+# =============================================================================
+
+def _run_pool(tiles, n_workers, settings, warm_snap, results) :
+    """
+    Process tiles on one pool, their timings or exceptions are put in results.
+    Output : broken -- True if a worker died
+             suspects -- tiles which were running when it died
+    """
+    started = multiprocessing.SimpleQueue()
+    running = set()
+    broken = False
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(tiles)), initializer=warm_worker, initargs=(warm_snap, started)) as executor :
+        futures = {executor.submit(run_tile, tile, settings):tile for tile in tiles}
+        for future in as_completed(futures) :
+            tile = futures[future]
+            while not started.empty() : # drained as tiles end, so that the pipe never fills and blocks the workers
+                running.add(started.get())
+            try :
+                results[tile] = timings = future.result()
+                print(colored('Tile processed :', 'cyan'), tile, f"{timings['n_poly']} polygons,",
+                      ', '.join(f'{step} {seconds_to_time(duration)}' for step, duration in timings.items() if step != 'n_poly'))
+            except BrokenProcessPool :
+                broken = True
+            except Exception as e :
+                results[tile] = e
+                print(colored('Tile failed :', 'red'), tile, repr(e))
+    while not started.empty() :
+        running.add(started.get())
+    return broken, [tile for tile in tiles if tile in running and tile not in results]
+
+def run_tiles(tiles, n_workers=os.cpu_count(), settings={}, max_attempts=2, warm_snap=True) :
+    """
+    Process tiles on a pool of n_workers long-lived workers. A failing tile is reported and doesn't stop the others.
+    If a worker dies (a JVM crash for instance) the tiles which were running are suspects : each one is retried alone
+    in a pool of 1 worker, where only a tile killing its own worker is charged an attempt, and given up after max_attempts.
+    The tiles not started yet go on in a new pool.
+    Output : dict tile -> timings of process_polygons_tile, or the exception raised
+    """
+    results = {}
+    remaining = list(tiles)
+    while remaining :
+        broken, suspects = _run_pool(remaining, n_workers, settings, warm_snap, results)
+        if broken and not suspects : # died before any tile, in warm_worker
+            suspects = [tile for tile in remaining if tile not in results]
+        for tile in suspects :
+            for attempt in range(max_attempts) :
+                if not _run_pool([tile], 1, settings, warm_snap, results)[0] : break
+            else :
+                results[tile] = BrokenProcessPool(f'worker died {max_attempts} times on {tile}')
+                print(colored('Tile failed :', 'red'), tile, 'worker died')
+        remaining = [tile for tile in remaining if tile not in results]
+    return results
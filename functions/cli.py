@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import argparse
+import runpy
+
+# Only argparse is imported to parse the command line, each command imports what it needs :
+# `python -m functions --help` starts in about 30 ms (bench_cold_start in benchmarks.py, target 150 ms),
+# `polygons` on tiles having their NDWI/<tile>.npy never starts the JVM.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # folder of main-NDWI.py
+
+# =============================================================================
+# %% Commands
+# =============================================================================
+
+def command_ndwi(args) :
+    """
+    Run main-NDWI for one tile
+    """
+    sys.argv = ['main-NDWI.py', args.tile, args.engine]
+    runpy.run_path(os.path.join(ROOT, 'main-NDWI.py'), run_name='__main__')
+
+def command_polygons(args) :
+    """
+    Run the steps of main-Polygons on several tiles, on a pool of workers (functions.batch)
+    """
+    from termcolor import colored
+    from .general import seconds_to_time, read_profile, write_chrome_trace
+    from .batch import run_tiles, up_to_date
+
+    listdir = os.listdir('NDWI')
+    list_tiles = args.tiles or sorted({x.split('.')[0] for x in listdir if x.split('.')[-1] in ('dim', 'npy')})
+    if not args.force :
+        skipped = [tile for tile in list_tiles if up_to_date(tile)]
+        if skipped : print(colored('Up to date, skipped :', 'cyan'), ' '.join(skipped))
+        list_tiles = [tile for tile in list_tiles if tile not in skipped]
+
+    t0 = time.time()
+    warm_snap = any(not os.path.exists(os.path.join('NDWI', f'{tile}.json')) for tile in list_tiles)
+    settings = {'contour_workers':args.contour_workers, 'profile_path':args.profile, 'polygon_min_size':args.min_size,
+                'simplify_tolerance_m':args.simplify, 'elevation_source':args.elevation, 'pole_tolerance':args.pole_tolerance,
+                'coalesce_radius_m':args.coalesce_radius}
+    results = run_tiles(list_tiles, args.workers, settings=settings, warm_snap=warm_snap)
+    failed = [tile for tile, result in results.items() if isinstance(result, Exception)]
+    print(colored(f'{len(results)-len(failed)}/{len(results)} tiles processed :', 'cyan'), seconds_to_time(time.time()-t0))
+    if failed : print(colored('Failed :', 'red'), ' '.join(failed))
+    if args.profile and args.trace :
+        write_chrome_trace(read_profile(args.profile), args.trace)
+
+def command_mosaic(args) :
+    """
+    Merge the Output xml of several tiles, lakes crossing tile borders are stitched (functions.mosaic)
+    """
+    from glob import iglob
+    from termcolor import colored
+    from .general import seconds_to_time
+    from .mosaic import mosaic_fsdata
+
+    output_folder = 'Output'
+    if args.tiles :
+        paths = [os.path.join(output_folder, f'{tile}.xml') for tile in args.tiles]
+    else :
+        paths = sorted(iglob(os.path.join(output_folder, 'T*.xml')))
+    assert len(paths) > 0, "No tile to merge"
+
+    t0 = time.time()
+    stats = mosaic_fsdata(paths, os.path.join(output_folder, f'{args.region}.xml'))
+    print(colored(f'Mosaic wrote : {seconds_to_time(time.time()-t0)}', 'green'),
+          f"{stats['tiles']} tiles, {stats['areas']} water areas, {stats['merged_groups']} merged across tiles")
+
+# =============================================================================
+# %% Command line
+# =============================================================================
+
+def build_parser() :
+    parser = argparse.ArgumentParser(prog='python -m functions', description='Water polygons for MSFS from Sentinel-2 products')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ndwi = commands.add_parser('ndwi', help='combine the products of Original into NDWI/<tile>.dim and .npy (main-NDWI)')
+    ndwi.add_argument('tile', help='tile to process, e.g. T14UPF')
+    ndwi.add_argument('-e', '--engine', choices=('snap', 'gdal'), default='snap', help='reading of the zips, SNAP by default')
+    ndwi.set_defaults(run=command_ndwi)
+
+    polygons = commands.add_parser('polygons', help='write the Output/<tile>.xml of the tiles of the NDWI folder (main-Polygons)')
+    polygons.add_argument('tiles', nargs='*', help='tiles to process, all the .dim of NDWI by default')
+    polygons.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='number of tiles processed at once')
+    polygons.add_argument('-c', '--contour-workers', type=int, default=None, help='processes contouring blocks of each tile, none by default')
+    polygons.add_argument('-f', '--force', action='store_true', help='also process tiles whose Output xml is up to date')
+    # settings of main-Polygons, same defaults
+    polygons.add_argument('--min-size', type=int, default=10, help='polygons of fewer vertices are dropped (polygon_min_size), 10 by default')
+    polygons.add_argument('-s', '--simplify', type=float, default=None, help='maximal displacement of the shores in meters (simplify_tolerance_m), no simplification by default')
+    polygons.add_argument('-e', '--elevation', choices=('opentopodata', 'dem'), default=None, help='source of the altitudes (elevation_source), altitudes set to 0 by default')
+    polygons.add_argument('--pole-tolerance', type=float, default=None, help='elevation point the farthest from shores, with this tolerance in degrees (pole_tolerance)')
+    polygons.add_argument('--coalesce-radius', type=float, default=None, help='one elevation point per group of polygons this close, in meters (coalesce_radius_m)')
+    polygons.add_argument('-p', '--profile', default=None, help='json lines file receiving the timings and memory peaks of the steps of each tile')
+    polygons.add_argument('--trace', default=None, help='Chrome trace written from the profile at the end (chrome://tracing, Perfetto)')
+    polygons.set_defaults(run=command_polygons)
+
+    mosaic = commands.add_parser('mosaic', help='merge the Output xml of several tiles into Output/<region>.xml (main-Mosaic)')
+    mosaic.add_argument('region', help='name of the merged file, written in Output/<region>.xml')
+    mosaic.add_argument('tiles', nargs='*', help='tiles to merge, all the Output/T*.xml by default')
+    mosaic.set_defaults(run=command_mosaic)
+    return parser
+
+def main(argv=None) :
+    args = build_parser().parse_args(argv)
+    args.run(args)
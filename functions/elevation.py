@@ -0,0 +1,413 @@
+from termcolor import colored
+import numpy as np
+import requests
+import time
+import threading
+from email.utils import parsedate_to_datetime
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import os
+from os.path import join
+from glob import iglob
+
+from .general import meters_to_latitude, profiler
+from .gdal_io import _import_gdal
+
+# =============================================================================
+# %% Elevation functions
+# =============================================================================
+
+class TokenBucket :
+    """
+    Thread-safe token bucket : at most `rate` requests per second on average, and `burst` requests at once.
+    """
+    def __init__(self, rate=1, burst=1) :
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) :
+        while True :
+            with self.lock :
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last)*self.rate)
+                self.last = now
+                if self.tokens >= 1 :
+                    self.tokens -= 1
+                    return
+                t_wait = (1 - self.tokens)/self.rate
+            time.sleep(t_wait)
+
+_sessions = {}
+
+def http_session(pool_size=8):
+    """
+    Shared requests.Session of the current process, keeping connections alive between requests
+    """
+    if pool_size not in _sessions :
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _sessions[pool_size] = session
+    return _sessions[pool_size]
+
+def _retry_after(value, default):
+    """
+    Seconds to wait from a Retry-After header, given in seconds or as an HTTP date. default if it is missing or can't be parsed
+    """
+    if value is None : return default
+    try :
+        return max(float(value), 0)
+    except ValueError :
+        pass
+    try :
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError, IndexError, OverflowError) :
+        return default
+
+def get_with_retry(url, params=None, session=None, limiter=None, max_retries=5, backoff=1, timeout=60, **kwargs):
+    """
+    GET url and return the response. Network errors, 429 and 5xx responses are retried at most max_retries times,
+    waiting backoff, 2*backoff, 4*backoff... seconds (or the Retry-After of the server). Other errors are raised.
+    kwargs are passed to session.get (auth, stream, headers...)
+    """
+    if session is None : session = http_session()
+    for attempt in range(max_retries + 1) :
+        if limiter is not None : limiter.acquire()
+        try :
+            response = session.get(url, params=params, timeout=timeout, **kwargs)
+            if response.status_code != 429 and response.status_code < 500 :
+                response.raise_for_status()
+                return response
+            error = f'HTTP {response.status_code}'
+            t_wait = _retry_after(response.headers.get('Retry-After'), backoff * 2**attempt)
+            response.close()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e :
+            error = type(e).__name__
+            t_wait = backoff * 2**attempt
+        if attempt < max_retries :
+            profiler.count('http_retries')
+            print(colored(f'\t{error}, retry {attempt+1}/{max_retries} in {t_wait:.0f}s', 'yellow'))
+            time.sleep(t_wait)
+    raise RuntimeError(f'{url} failed after {max_retries} retries : {error}')
+
+def get_json_with_retry(url, params=None, session=None, limiter=None, max_retries=5, backoff=1, timeout=60):
+    """
+    GET url and return its json, retried as get_with_retry
+    """
+    return get_with_retry(url, params, session, limiter, max_retries, backoff, timeout).json()
+
+class ElevationCache :
+    """
+    Persistent SQLite cache of elevations. Points are quantized on a grid of grid_m meters (30 m is the DEM cell),
+    so that nearly identical points of successive runs share their elevation. When the cache holds more than
+    max_entries points, the least recently used ones are evicted. hits and misses are counted since opening.
+    """
+    def __init__(self, path='elevation_cache.sqlite', grid_m=30, max_entries=5_000_000) :
+        self.path = path
+        self.step = meters_to_latitude(grid_m) # in degrees, the same step is used for longitudes
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS elevation (source TEXT, qlat INTEGER, qlon INTEGER, elevation REAL, '
+                        'last_used REAL, PRIMARY KEY (source, qlat, qlon)) WITHOUT ROWID')
+        self.db.execute('CREATE INDEX IF NOT EXISTS elevation_last_used ON elevation (last_used)')
+        self.db.commit()
+
+    def keys(self, lat_lon_array) :
+        q = np.floor(np.asarray(lat_lon_array, dtype=float)/self.step).astype(np.int64)
+        return [(int(qlat), int(qlon)) for qlat, qlon in q]
+
+    def get(self, lat_lon_array, source='mapzen') :
+        """
+        Output : elevations -- array of shape (n,), nan where the point is not cached
+                 missing -- boolean array of shape (n,), True where the point is not cached
+        """
+        keys = self.keys(lat_lon_array)
+        found = {}
+        for k0 in range(0, len(keys), 400) : # less than the 999 parameters of old SQLite versions
+            chunk = keys[k0:k0+400]
+            condition = ' OR '.join(['(qlat=? AND qlon=?)']*len(chunk))
+            rows = self.db.execute(f'SELECT qlat, qlon, elevation FROM elevation WHERE source=? AND ({condition})',
+                                   [source] + [x for key in chunk for x in key]).fetchall()
+            found.update({(qlat, qlon):elevation for qlat, qlon, elevation in rows})
+        elevations = np.array([found.get(key, np.nan) for key in keys], dtype=float)
+        missing = np.array([key not in found for key in keys], dtype=bool)
+        if found :
+            now = time.time()
+            self.db.executemany('UPDATE elevation SET last_used=? WHERE source=? AND qlat=? AND qlon=?',
+                                [(now, source) + key for key in found])
+            self.db.commit()
+        self.hits += int((~missing).sum())
+        self.misses += int(missing.sum())
+        return elevations, missing
+
+    def put(self, lat_lon_array, elevations, source='mapzen') :
+        now = time.time()
+        self.db.executemany('INSERT OR REPLACE INTO elevation VALUES (?, ?, ?, ?, ?)',
+                            [(source,) + key + (float(elevation), now) for key, elevation in zip(self.keys(lat_lon_array), elevations)
+                             if not np.isnan(elevation)])
+        n_entries = self.db.execute('SELECT COUNT(*) FROM elevation').fetchone()[0]
+        if n_entries > self.max_entries :
+            self.db.execute('DELETE FROM elevation WHERE (source, qlat, qlon) IN '
+                            '(SELECT source, qlat, qlon FROM elevation ORDER BY last_used LIMIT ?)', (n_entries - self.max_entries,))
+        self.db.commit()
+
+    def stats(self) :
+        n_entries = self.db.execute('SELECT COUNT(*) FROM elevation').fetchone()[0]
+        return {'hits':self.hits, 'misses':self.misses, 'entries':n_entries}
+
+    def close(self) :
+        self.db.close()
+
+def get_elevation_openelevation(lat, lon, url='https://api.open-elevation.com/api/v1/lookup', max_retries=5):
+    """
+    Return elevation from latitude, longitude based on the SRTM mesh, pretty long to respond
+    """
+    assert -60 <= lat <= 60, "SRTM dataset has data only in latitudes between -60° and 60°"
+    r = get_json_with_retry(url, params={'locations':f'{lat},{lon}'}, max_retries=max_retries)
+    elevation = r['results'][0]['elevation']
+    return elevation
+
+def get_elevation_opentopodata(lat, lon, source = 'mapzen', url='https://api.opentopodata.org/v1', max_retries=5):
+    r = get_json_with_retry(f'{url}/{source}', params={'locations':f'{lat},{lon}'}, max_retries=max_retries)
+    if r['status'] != 'OK' :
+        print(r.get('error', r))
+    elevation = r['results'][0]['elevation']
+    return elevation
+
+def get_multiple_elevation_opentopodata(lat_lon_array, source = 'mapzen', url='https://api.opentopodata.org/v1',
+                                        batch_size=100, n_workers=4, rate=1, max_retries=5, cache=None):
+    """ 
+    Entry : lat_lon_array, an array of shape (n, 2) where n is the number of coordinates
+            and coordinates are presented in the order lat, lon in the decimal format
+    Output : an array of shape (n,) with all altitudes at the given points.
+    
+    Batches of batch_size points (100 at most on opentopodata.org) are sent by n_workers threads sharing one
+    connection pool, all together limited to rate requests per second. Failed batches are retried with backoff.
+    With an ElevationCache, only the points missing in the cache are requested, and their elevations are then cached.
+    """
+    if cache is not None :
+        elevations, missing = cache.get(lat_lon_array, source)
+        if missing.any() :
+            elevations[missing] = get_multiple_elevation_opentopodata(np.asarray(lat_lon_array)[missing], source, url,
+                                                                      batch_size, n_workers, rate, max_retries)
+            cache.put(np.asarray(lat_lon_array)[missing], elevations[missing], source)
+        return elevations
+    n = len(lat_lon_array)
+    elevations = np.zeros(n,)
+    if n == 0 : return elevations
+    session = http_session(n_workers)
+    limiter = TokenBucket(rate, burst=n_workers)
+
+    def request_batch(i0) :
+        batch = lat_lon_array[i0:i0+batch_size]
+        locations = '|'.join(f'{lat},{lon}' for lat, lon in batch)
+        r = get_json_with_retry(f'{url}/{source}', params={'locations':locations}, session=session, limiter=limiter, max_retries=max_retries)
+        profiler.count('elevation_requests')
+        if 'error' in r.keys() :
+            print(r['error'])
+        elevations[i0:i0+len(batch)] = [np.nan if res['elevation'] is None else res['elevation'] for res in r['results']]
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor :
+        for future in [executor.submit(request_batch, i0) for i0 in range(0, n, batch_size)] :
+            future.result() # raises the error of a batch which failed despite retries
+        
+    return elevations
+
+def _pairs_within(xy, radius):
+    """
+    Pairs (i, j) of the points of xy (array of shape (n, 2)) closer than radius : points are hashed in cells
+    of radius, and compared with the points of their cell and of the 4 following neighbour cells.
+    Output : i, j -- arrays of indices, each pair once
+    """
+    cells = np.floor(xy/radius).astype(np.int64)
+    cells -= cells.min(axis=0) - 1 # neighbour cells stay positive
+    n_rows = cells[:,1].max() + 2
+    keys = cells[:,0]*n_rows + cells[:,1]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    pairs_i, pairs_j = [], []
+    for dx, dy in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)) :
+        start = np.searchsorted(sorted_keys, keys + dx*n_rows + dy, side='left')
+        stop = np.searchsorted(sorted_keys, keys + dx*n_rows + dy, side='right')
+        counts = stop - start
+        i = np.repeat(np.arange(len(xy)), counts)
+        j = order[np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())] # each range start..stop
+        if (dx, dy) == (0, 0) : i, j = i[i < j], j[i < j]
+        close = ((xy[i] - xy[j])**2).sum(axis=1) <= radius**2
+        pairs_i.append(i[close]); pairs_j.append(j[close])
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+def _components(n, i, j):
+    """
+    Connected components of the graph of n nodes and edges (i, j), by union-find with labels propagated
+    on all edges at once. Output : array of shape (n,), smallest node of the component of each node
+    """
+    labels = np.arange(n)
+    while True :
+        smallest = np.minimum(labels[i], labels[j])
+        previous = labels.copy()
+        np.minimum.at(labels, i, smallest)
+        np.minimum.at(labels, j, smallest)
+        while True : # path compression
+            root = labels[labels]
+            if np.array_equal(root, labels) : break
+            labels = root
+        if np.array_equal(labels, previous) : return labels
+
+def coalesce_points(lat_lon_array, radius_m=50):
+    """
+    Group the points closer than radius_m : points within radius_m of each other are merged (union-find on the
+    pairs of _pairs_within, longitudes scaled at the mean latitude), then each merged component is split so that
+    every point is within radius_m of the representative of its group. The representative is the member the closest
+    to the centroid of the members left, a point of the water of one of the polygons.
+    Output : representatives -- array of shape (n_groups, 2), latitude, longitude
+             group_of_point -- array of shape (n,), index of the group of each point
+    """
+    lat_lon = np.asarray(lat_lon_array, dtype=float).reshape(-1, 2)
+    if len(lat_lon) == 0 : return lat_lon, np.zeros(0, dtype=int)
+    scale = np.array([1, np.cos(np.radians(lat_lon[:,0].mean()))]) # degrees to comparable distances
+    xy = lat_lon*scale
+    radius = meters_to_latitude(radius_m)
+    component = _components(len(xy), *_pairs_within(xy, radius))
+    group_of_point = np.full(len(xy), -1)
+    representatives = []
+    order = np.argsort(component, kind='stable')
+    for members in np.split(order, np.flatnonzero(np.diff(component[order])) + 1) :
+        while len(members) :
+            if len(members) == 1 :
+                first, inside = members[0], members
+            else :
+                first = members[np.argmin(((xy[members] - xy[members].mean(axis=0))**2).sum(axis=1))]
+                inside = members[((xy[members] - xy[first])**2).sum(axis=1) <= radius**2]
+            group_of_point[inside] = len(representatives)
+            representatives.append(first)
+            members = members[group_of_point[members] < 0]
+    return lat_lon[representatives], group_of_point
+
+def get_multiple_elevation_coalesced(lat_lon_array, radius_m=50, get_elevations=None, batch_size=100, **kwargs):
+    """
+    Elevations at lat_lon_array, requesting one point per group of coalesce_points, the elevation of a group
+    being given back to all of its points. Ponds a few meters apart share an elevation within the DEM precision.
+    get_elevations : get_multiple_elevation_opentopodata by default, called with batch_size and kwargs
+    Output : elevations -- array of shape (n,)
+             stats -- dict : points, points requested, requests saved (batches of batch_size)
+    """
+    if get_elevations is None : get_elevations = get_multiple_elevation_opentopodata
+    representatives, group_of_point = coalesce_points(lat_lon_array, radius_m)
+    elevations = np.asarray(get_elevations(representatives, batch_size=batch_size, **kwargs))[group_of_point]
+    n_points, n_requested = len(group_of_point), len(representatives)
+    requests_saved = -(-n_points//batch_size) - -(-n_requested//batch_size)
+    profiler.count('elevation_requests_saved', requests_saved)
+    return elevations, {'points':n_points, 'requested':n_requested, 'requests_saved':requests_saved}
+
+def _hgt_bounds(file_name):
+    """
+    Bounds lon_min, lat_min, lon_max, lat_max of a SRTM tile from its name, like N50W100.hgt
+    """
+    name = os.path.basename(file_name)[:7].upper()
+    lat0 = int(name[1:3]) * (1 if name[0] == 'N' else -1)
+    lon0 = int(name[4:7]) * (1 if name[3] == 'E' else -1)
+    return lon0, lat0, lon0+1, lat0+1
+
+def _bilinear(read_window, n_rows, n_cols, rows, cols, void=None):
+    """
+    Bilinear interpolation at fractional pixel coordinates (rows, cols) of a raster of shape (n_rows, n_cols),
+    read_window(r0, r1, c0, c1) returning raster[r0:r1, c0:c1]. Only the window around the points is read.
+    Points next to a pixel equal to void get nan.
+    """
+    rows = np.clip(rows, 0, n_rows-1)
+    cols = np.clip(cols, 0, n_cols-1)
+    r = np.minimum(np.floor(rows).astype(int), n_rows-2)
+    c = np.minimum(np.floor(cols).astype(int), n_cols-2)
+    r0, c0 = r.min(), c.min()
+    window = read_window(r0, r.max()+2, c0, c.max()+2).astype(float)
+    if void is not None :
+        window[window == void] = np.nan # a void makes its interpolated neighbourhood nan
+    r -= r0; c -= c0
+    dr = rows - r0 - r
+    dc = cols - c0 - c
+    return (window[r, c]*(1-dr)*(1-dc) + window[r, c+1]*(1-dr)*dc
+            + window[r+1, c]*dr*(1-dc) + window[r+1, c+1]*dr*dc)
+
+class DemIndex :
+    """
+    Index of a local folder of DEM tiles : SRTM .hgt (read through np.memmap) and GeoTIFF (read through GDAL).
+    Only the tiles containing some of the requested points are opened.
+    """
+    def __init__(self, dem_folder='DEM') :
+        self.tiles = [] # (lon_min, lat_min, lon_max, lat_max, path)
+        for path in sorted(iglob(join(dem_folder, '**', '*.hgt'), recursive=True)) :
+            self.tiles.append((*_hgt_bounds(path), path))
+        tif_paths = sorted(iglob(join(dem_folder, '**', '*.tif'), recursive=True))
+        if tif_paths :
+            gdal = _import_gdal()
+            for path in tif_paths :
+                dataset = gdal.Open(path)
+                x0, dx, _, y0, _, dy = dataset.GetGeoTransform()
+                x1, y1 = x0 + dx*dataset.RasterXSize, y0 + dy*dataset.RasterYSize
+                self.tiles.append((min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1), path))
+        self.bounds = np.array([tile[:4] for tile in self.tiles], dtype=float).reshape(-1, 4)
+
+    def tiles_for_bounds(self, lon_min, lat_min, lon_max, lat_max) :
+        """
+        Paths of the DEM tiles intersecting a bounding box, a Sentinel-2 tile for instance
+        """
+        b = self.bounds
+        touching = (b[:, 0] <= lon_max) & (b[:, 2] >= lon_min) & (b[:, 1] <= lat_max) & (b[:, 3] >= lat_min)
+        return [self.tiles[k][4] for k in np.flatnonzero(touching)]
+
+    def sample(self, path, lat, lon) :
+        """
+        Bilinear elevations at the points (lat, lon) arrays which are inside the tile of path, nan on voids
+        """
+        if path.lower().endswith('.hgt') :
+            n = int(round(np.sqrt(os.path.getsize(path)//2))) # 1201 (3 arc-seconds) or 3601 (1 arc-second)
+            data = np.memmap(path, dtype='>i2', mode='r', shape=(n, n))
+            lon0, lat0, _, _ = _hgt_bounds(path)
+            rows, cols = (lat0 + 1 - lat)*(n-1), (lon - lon0)*(n-1) # first and last rows/columns are on the tile edges
+            elevations = _bilinear(lambda r0, r1, c0, c1 : data[r0:r1, c0:c1], n, n, rows, cols, void=-32768)
+            del data
+        else :
+            gdal = _import_gdal()
+            dataset = gdal.Open(path)
+            x0, dx, _, y0, _, dy = dataset.GetGeoTransform()
+            band = dataset.GetRasterBand(1)
+            rows, cols = (lat - y0)/dy - 0.5, (lon - x0)/dx - 0.5 # values are given at pixel centers
+            elevations = _bilinear(lambda r0, r1, c0, c1 : band.ReadAsArray(int(c0), int(r0), int(c1-c0), int(r1-r0)),
+                                   dataset.RasterYSize, dataset.RasterXSize, rows, cols, void=band.GetNoDataValue())
+        return elevations
+
+    def elevations(self, lat_lon_array) :
+        lat_lon_array = np.asarray(lat_lon_array, dtype=float).reshape(-1, 2)
+        lat, lon = lat_lon_array[:, 0], lat_lon_array[:, 1]
+        elevations = np.full(len(lat_lon_array), np.nan)
+        if len(lat_lon_array) == 0 : return elevations
+        todo = np.ones(len(lat_lon_array), dtype=bool)
+        for k in np.flatnonzero((self.bounds[:, 0] <= lon.max()) & (self.bounds[:, 2] >= lon.min())
+                                & (self.bounds[:, 1] <= lat.max()) & (self.bounds[:, 3] >= lat.min())) :
+            lon_min, lat_min, lon_max, lat_max, path = self.tiles[k]
+            inside = todo & (lon_min <= lon) & (lon <= lon_max) & (lat_min <= lat) & (lat <= lat_max)
+            if inside.any() :
+                elevations[inside] = self.sample(path, lat[inside], lon[inside])
+                todo &= ~inside
+        if todo.any() :
+            print(colored('Warning :', 'red'), f'{todo.sum()} points outside of the DEM tiles')
+        return elevations
+
+_dem_indexes = {}
+
+def get_multiple_elevation_dem(lat_lon_array, dem_folder='DEM'):
+    """ 
+    Same as get_multiple_elevation_opentopodata, from the DEM tiles of a local folder, offline.
+    Entry : lat_lon_array, an array of shape (n, 2) where n is the number of coordinates
+            and coordinates are presented in the order lat, lon in the decimal format
+    Output : an array of shape (n,) with all altitudes at the given points, nan outside of the DEM or on voids.
+    """
+    if dem_folder not in _dem_indexes :
+        _dem_indexes[dem_folder] = DemIndex(dem_folder)
+    return _dem_indexes[dem_folder].elevations(lat_lon_array)
@@ -0,0 +1,89 @@
+import numpy as np
+import uuid
+import gzip
+
+# =============================================================================
+# %% XML writing functions
+# =============================================================================
+
+def vertex_block(segment):
+    """
+    All the <Vertex> lines of a segment (np array of lon, lat) as one string, formatted in one operation.
+    The last vertex is dropped when it is the same as the first. Floats are written with their repr as f-strings do.
+    """
+    segment = np.asarray(segment, dtype=float)
+    if not (segment[-1] - segment[0]).any() : # the last vertex is the same as the first
+        segment = segment[:-1]
+    return ('\t\t<Vertex lat="%r" lon="%r"/>\n' * len(segment)) % tuple(segment[:, ::-1].ravel().tolist())
+
+def fsdata_polygons(Segments, exclude_water, altitude_list, main_exclusion, water_type=3):
+    """
+    Generator of the FSData text of each polygon, one string per polygon, in the order main-Polygons writes them :
+    water and exclusion polygons, then the main exclusion polygon (main_exclusion, the tile footprint).
+    """
+    n_poly = len(Segments)
+    for i in range(n_poly):
+        if exclude_water[i] :
+            yield ''.join(lines_exclude_water_polygon(Segments[i], group_index = i+1, water_type = water_type))
+        else :
+            yield ''.join(lines_water_polygon(Segments[i], group_index = i+1, altitude = altitude_list[i], water_type = water_type))
+    yield ''.join(lines_exclude_water_polygon(main_exclusion, group_index = n_poly, name = 'Main Exclusion', water_type = -1))
+
+def write_fsdata(path, polygons, compress=False, buffer_size=2**22):
+    """
+    Write the FSData xml file from an iterable of polygon texts (fsdata_polygons), without keeping them in memory.
+    The file is written through a buffer of buffer_size bytes, or gzipped when compress is True.
+    """
+    if compress :
+        f = gzip.open(path, 'wt', compresslevel=6)
+    else :
+        f = open(path, 'w', buffering=buffer_size)
+    with f :
+        f.write('<?xml version="1.0"?>\n<FSData version="9.0">\n')
+        for polygon in polygons :
+            f.write(polygon)
+        f.write('</FSData>')
+
+def lines_water_polygon(segment, group_index = 1, water_type=1, altitude=0, name = "Water Polygon"):
+    """
+    segment : the np array with all vertices coordinates
+    group_index : the number to increment
+    water_type : 0=River; 1=Waste Water; 3=Pond; 4=Lake; 5=Ocean; -1 = Water # Warning : Ocean set the altitude at 0; Lake set constant altitude
+    altitude : the elevation of the water area
+    name : the name of the water which will be visible on SDK
+    """
+    lines = []
+    # open polygon environment
+    lines.append(f'\t<Polygon displayName="{name}" groupIndex="{group_index}" altitude="{altitude}">\n')
+    # then attributes :
+    lines.append('\t\t<Attribute name="UniqueGUID" guid="{359C73E8-06BE-4FB2-ABCB-EC942F7761D0}" type="GUID" value="{' + str(uuid.uuid4()) + '}"/>\n')
+    lines.append('\t\t<Attribute name="IsWater" guid="{684AFC09-9B38-4431-8D76-E825F54A4DFF}" type="UINT8" value="1"/>\n')
+    if water_type !=-1 : lines.append('\t\t<Attribute name="WaterType" guid="{3F8514F8-FAA8-4B94-AB7F-DC2078A4B888}" type="UINT32" value="' + str(water_type) + '"/>\n')
+    # all vertices
+    lines.append(vertex_block(segment))
+    # close the polygon environment
+    lines.append('\t</Polygon>\n')
+    return lines
+
+def lines_exclude_water_polygon(segment, group_index = 1, water_type=-1, altitude=0, name = "Exclusion Polygon"):
+    """
+    segment : the np array with all vertices coordinates
+    group_index : the number to increment
+    water_type : 0=River; 1=Waste Water; 3=Pond; 4=Lake; 5=Ocean; -1 = Water
+    altitude : the elevation of the water area
+    name : the name of the water which will be visible on SDK
+    """
+    lines = []
+    # open polygon environment
+    lines.append(f'\t<Polygon displayName="{name}" groupIndex="{group_index}" altitude="{altitude}">\n')
+    # then attributes :
+    lines.append('\t\t<Attribute name="UniqueGUID" guid="{359C73E8-06BE-4FB2-ABCB-EC942F7761D0}" type="GUID" value="{' + str(uuid.uuid4()) + '}"/>\n')
+    lines.append('\t\t<Attribute name="IsWater" guid="{684AFC09-9B38-4431-8D76-E825F54A4DFF}" type="UINT8" value="1"/>\n')
+    lines.append('\t\t<Attribute name="IsWaterExclusion" guid="{972B7BAC-F620-4D6E-9724-E70BF8A450DD}" type="UINT8" value="1"/>\n')
+    if water_type !=-1 : lines.append('\t\t<Attribute name="WaterType" guid="{3F8514F8-FAA8-4B94-AB7F-DC2078A4B888}" type="UINT32" value="' + str(water_type) + '"/>\n')
+    # all vertices
+    lines.append(vertex_block(segment))
+    # close the polygon environment
+    lines.append('\t</Polygon>\n')
+    # and write all of this
+    return lines
@@ -0,0 +1,127 @@
+import numpy as np
+import xml.etree.ElementTree as ET
+from zipfile import ZipFile
+
+from .raster import ndwi_formula
+
+# =============================================================================
+# %% GDAL functions (Sentinel-2 zip read without SNAP)
+# =============================================================================
+
+def _import_gdal():
+    try :
+        from osgeo import gdal
+    except ImportError :
+        import gdal
+    return gdal
+
+def _import_osr():
+    try :
+        from osgeo import osr
+    except ImportError :
+        import osr
+    return osr
+
+def s2_zip_members(zip_path):
+    """
+    Find in a Sentinel-2 Level-2A zip the rasters main-NDWI needs, and the reflectance scaling of B3 and B8.
+    Output : dict with the /vsizip/ paths of 'B3', 'B8' (10 m), 'clouds' and 'classification' (20 m),
+             and 'scale', 'offset_B3', 'offset_B8' so that reflectance = (DN + offset)/scale
+    """
+    suffixes = {'B3':'_B03_10m.jp2', 'B8':'_B08_10m.jp2', 'clouds':'MSK_CLDPRB_20m.jp2', 'classification':'_SCL_20m.jp2'}
+    members = {'scale':10000., 'offset_B3':0., 'offset_B8':0.}
+    with ZipFile(zip_path) as archive :
+        names = archive.namelist()
+        for key, suffix in suffixes.items() :
+            found = [name for name in names if name.endswith(suffix)]
+            assert len(found) > 0, f"{suffix} not found in {zip_path}"
+            members[key] = f'/vsizip/{zip_path}/{found[0]}'
+        mtd = [name for name in names if name.split('/')[-1].startswith('MTD_MSIL') and name.count('/') == 1]
+        if mtd :
+            root = ET.fromstring(archive.read(mtd[0]))
+            for element in root.iter() :
+                tag = element.tag.split('}')[-1]
+                if tag in ('BOA_QUANTIFICATION_VALUE', 'QUANTIFICATION_VALUE') :
+                    members['scale'] = float(element.text)
+                # processing baselines 04.00 and later add an offset to digital numbers, band_id 2 is B3 and 7 is B8
+                if tag in ('BOA_ADD_OFFSET', 'RADIO_ADD_OFFSET') and element.get('band_id') in ('2', '7') :
+                    members['offset_B3' if element.get('band_id') == '2' else 'offset_B8'] = float(element.text)
+    return members
+
+def _read_20m(dataset, y0, n_rows, w):
+    """
+    Rows y0 to y0+n_rows of the 10 m grid (w columns) of a 20 m dataset, nearest neighbour : the 10 m pixel (r, c)
+    takes the 20 m pixel (r//2, c//2) which contains its center, as the SNAP Resample does when upsampling.
+    Only the 20 m rows covering the strip are read.
+    """
+    r0, r1 = y0//2, min((y0 + n_rows + 1)//2, dataset.RasterYSize)
+    data = dataset.GetRasterBand(1).ReadAsArray(0, r0, dataset.RasterXSize, r1-r0).astype(np.float32)
+    data = np.repeat(np.repeat(data, 2, axis=0), 2, axis=1)
+    return data[y0 - 2*r0:y0 - 2*r0 + n_rows, :w]
+
+def gdal_strip_reader(zip_paths):
+    """
+    Create the read_strip function of composite_ndwi for Sentinel-2 zips read with GDAL, no JVM involved.
+    B3 and B8 are read at 10 m, cloud confidence and classification at 20 m and upsampled on demand
+    to 10 m with a nearest neighbour (as the SNAP Resample on B2 does).
+    Output : read_strip, w, h
+    """
+    gdal = _import_gdal()
+    products = []
+    for zip_path in zip_paths :
+        members = s2_zip_members(zip_path)
+        datasets = {key:gdal.Open(members[key]) for key in ('B3', 'B8', 'clouds', 'classification')}
+        products.append((members, datasets))
+    w = products[0][1]['B3'].RasterXSize
+    h = products[0][1]['B3'].RasterYSize
+
+    def read_strip(i, y0, n_rows) :
+        members, datasets = products[i]
+        B3 = datasets['B3'].GetRasterBand(1).ReadAsArray(0, y0, w, n_rows).astype(np.float32)
+        B8 = datasets['B8'].GetRasterBand(1).ReadAsArray(0, y0, w, n_rows).astype(np.float32)
+        NDWI_data = ndwi_formula((B3 + members['offset_B3'])/members['scale'], (B8 + members['offset_B8'])/members['scale'])
+        return NDWI_data, _read_20m(datasets['clouds'], y0, n_rows, w), _read_20m(datasets['classification'], y0, n_rows, w)
+
+    return read_strip, w, h
+
+def gdal_geocoding(zip_path, corner_step=None):
+    """
+    Geocoding of the 10 m grid of a Sentinel-2 zip from the geotransform and projection of its B3 raster, no JVM involved :
+    the pixel centers of the 4 edges are projected to lon, lat as snappy.ProductUtils.createGeoBoundary(product, 1) gives them.
+    corner_step : pixels between the points of the footprint, h//10 by default (as main-NDWI with SNAP)
+    Output : geocoding -- EdgeGeoCoding
+             corners -- array of shape (n, 2), lon, lat of the footprint, clockwise from the top left corner
+    """
+    from .geometry import EdgeGeoCoding
+    gdal, osr = _import_gdal(), _import_osr()
+    dataset = gdal.Open(s2_zip_members(zip_path)['B3'])
+    w, h = dataset.RasterXSize, dataset.RasterYSize
+    gt = dataset.GetGeoTransform()
+    source = osr.SpatialReference(wkt=dataset.GetProjection())
+    target = osr.SpatialReference()
+    target.ImportFromEPSG(4326)
+    if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER') : # GDAL 3 : lon, lat order as GDAL 2
+        source.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        target.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(source, target)
+
+    def lon_lat(rows, cols) :
+        rows, cols = np.asarray(rows, dtype=float) + 0.5, np.asarray(cols, dtype=float) + 0.5 # pixel centers
+        x = gt[0] + cols*gt[1] + rows*gt[2]
+        y = gt[3] + cols*gt[4] + rows*gt[5]
+        points = np.array(transform.TransformPoints(np.column_stack((x, y)).tolist()))
+        return points[:, 0], points[:, 1]
+
+    rows, cols = np.arange(h), np.arange(w)
+    x_left, _ = lon_lat(rows, np.zeros(h))
+    x_right, _ = lon_lat(rows, np.full(h, w-1))
+    _, y_top = lon_lat(np.zeros(w), cols)
+    _, y_bottom = lon_lat(np.full(w, h-1), cols)
+
+    step = corner_step or max(h//10, 1)
+    boundary_rows = np.concatenate((np.zeros(len(range(0, w-1, step))), np.arange(0, h-1, step),
+                                    np.full(len(range(w-1, 0, -step)), h-1), np.arange(h-1, 0, -step)))
+    boundary_cols = np.concatenate((np.arange(0, w-1, step), np.full(len(range(0, h-1, step)), w-1),
+                                    np.arange(w-1, 0, -step), np.zeros(len(range(h-1, 0, -step)))))
+    corners = np.column_stack(lon_lat(boundary_rows, boundary_cols))
+    return EdgeGeoCoding(x_left, x_right, y_top, y_bottom), corners
@@ -0,0 +1,146 @@
+from termcolor import colored
+import time
+import math
+import json
+import threading
+import os
+import sys
+import tracemalloc
+from contextlib import contextmanager
+
+# =============================================================================
+# %% General functions
+# =============================================================================
+
+def seconds_to_time(seconds, n_decimals=2) :
+    h = int(seconds//3600)
+    m = int(seconds//60 - h*60)
+    s = seconds - m*60 - h*3600
+    if h > 0 :
+        return f'{h:0>2}:{m:0>2}:{round(s):0>2}'
+    elif m > 0 : return f'{m:0>2}:{round(s):0>2}'
+    else : return '{:.{}f}s'.format(s, n_decimals)
+
+def meters_to_latitude(m) :
+    """
+    Convert a vertical distance on earth into a latitude angle
+    """
+    r_earth = 6371e3
+    # r_earth * arc_rad = m
+    arc_rad = m/r_earth
+    arc_deg = arc_rad * 180/math.pi
+    return arc_deg
+
+# =============================================================================
+# %% Instrumentation
+# =============================================================================
+
+def _rss_peak_mb():
+    """
+    Peak resident memory of the process so far, in MB (None where the resource module is missing, on Windows)
+    """
+    try :
+        import resource
+    except ImportError :
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/2**20 if sys.platform == 'darwin' else peak/2**10 # bytes on macOS, kB on Linux
+
+class Profiler :
+    """
+    Records spans, the stages of a tile : wall time, CPU time of the process, peak RSS of the process at the end of
+    the span and peak of the memory traced by tracemalloc during the span, with counters (polygons, vertices,
+    elevation requests...). Spans can be nested, a span gets the tags (tile...) of its parent.
+    Spans are opened with `with profiler.span(stage, tile=...)`, or start and stop in cell by cell scripts.
+    Records are exported as json lines, one span per line, which write_chrome_trace converts for chrome://tracing or Perfetto.
+    """
+    def __init__(self, trace_memory=True) :
+        self.trace_memory = trace_memory
+        self.records = []
+        self.stack = []
+        self.lock = threading.Lock()
+        self.started_tracing = False
+
+    def start(self, stage, **tags) :
+        if self.trace_memory and not tracemalloc.is_tracing() :
+            tracemalloc.start()
+            self.started_tracing = True
+        if self.stack :
+            tags = {**self.stack[-1]['tags'], **tags}
+            if self.trace_memory : # the peak of the parent before this span
+                self.stack[-1]['traced_peak'] = max(self.stack[-1]['traced_peak'], tracemalloc.get_traced_memory()[1])
+        if self.trace_memory : tracemalloc.reset_peak()
+        self.stack.append({'stage':stage, 'tags':tags, 'start':time.time(), 'cpu':time.process_time(),
+                           'traced_peak':0, 'counters':{}, 'depth':len(self.stack)})
+
+    def stop(self, message=None) :
+        """
+        Close the last span opened, print message with its duration if given. Output : the record of the span
+        """
+        span = self.stack.pop()
+        record = {'stage':span['stage'], **span['tags'], 'start':span['start'], 'wall_s':time.time() - span['start'],
+                  'cpu_s':time.process_time() - span['cpu'], 'rss_peak_mb':_rss_peak_mb(), 'traced_peak_mb':None,
+                  'counters':span['counters'], 'depth':span['depth'], 'pid':os.getpid()}
+        if self.trace_memory :
+            traced_peak = max(span['traced_peak'], tracemalloc.get_traced_memory()[1])
+            record['traced_peak_mb'] = traced_peak/2**20
+            if self.stack :
+                self.stack[-1]['traced_peak'] = max(self.stack[-1]['traced_peak'], traced_peak)
+                tracemalloc.reset_peak()
+            elif self.started_tracing :
+                tracemalloc.stop()
+                self.started_tracing = False
+        self.records.append(record)
+        if message is not None :
+            print(colored(f'{message} : {seconds_to_time(record["wall_s"])}', 'green'))
+        return record
+
+    @contextmanager
+    def span(self, stage, **tags) :
+        self.start(stage, **tags)
+        try :
+            yield
+        finally :
+            self.stop()
+
+    def count(self, counter, n=1) :
+        """
+        Add n to counter in all the open spans. Can be called from worker threads.
+        """
+        with self.lock :
+            for span in self.stack :
+                span['counters'][counter] = span['counters'].get(counter, 0) + n
+
+    def write_jsonl(self, path, clear=True) :
+        """
+        Append the records to the json lines file path, at once so that several processes can share it
+        """
+        with open(path, 'a') as file :
+            file.write(''.join(json.dumps(record) + '\n' for record in self.records))
+        if clear : self.records = []
+
+profiler = Profiler(trace_memory=False) # profiler of the process, used by the functions of this package ; tracemalloc slows allocations down, set trace_memory to record memory peaks
+
+def read_profile(path):
+    """
+    Records of the json lines file of Profiler.write_jsonl
+    """
+    with open(path) as file :
+        return [json.loads(line) for line in file if line.strip()]
+
+def write_chrome_trace(records, path):
+    """
+    Write the records of read_profile in the Chrome trace format : one complete event per span,
+    one process per run (pid), and counter events for the memory peaks.
+    """
+    events = []
+    for record in records :
+        tags = {key:value for key, value in record.items() if key not in ('stage', 'start', 'wall_s', 'pid', 'depth')}
+        ts = record['start']*1e6
+        events.append({'name':record['stage'], 'cat':record.get('tile', ''), 'ph':'X', 'ts':ts, 'dur':record['wall_s']*1e6,
+                       'pid':record['pid'], 'tid':record['depth'], 'args':tags})
+        memory = {key:record[key] for key in ('rss_peak_mb', 'traced_peak_mb') if record.get(key) is not None}
+        if memory :
+            events.append({'name':'memory (MB)', 'ph':'C', 'ts':ts + record['wall_s']*1e6, 'pid':record['pid'], 'args':memory})
+    with open(path, 'w') as file :
+        json.dump({'traceEvents':events, 'displayTimeUnit':'ms'}, file)
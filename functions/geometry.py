@@ -0,0 +1,196 @@
+import numpy as np
+from shapely.strtree import STRtree
+from shapely.prepared import prep
+from shapely.geometry import Polygon
+from shapely.ops import polylabel
+import shapely
+
+from .general import meters_to_latitude
+
+# =============================================================================
+# %% Geometry functions
+# =============================================================================
+
+def _strtree_query(tree, geom, index_of):
+    """
+    Indices of the tree geometries whose bounding box intersects geom.
+    shapely 2 returns indices, shapely 1.x returns geometries : both are handled.
+    """
+    result = tree.query(geom)
+    if len(result) and not isinstance(result[0], (int, np.integer)) :
+        return [index_of[id(g)] for g in result]
+    return [int(k) for k in result]
+
+def nest_polygons(polygon_list, point_list):
+    """
+    Find which polygons contain which others, using a STR-tree on bounding boxes and prepared geometries.
+    point_list[i] is a point of the contour of polygon_list[i] (not a vertex shared with another contour).
+    
+    Output : exclude_water -- array of shape (n,), 1 if the polygon is inside an odd number of polygons
+             islands_of_i -- dict, polygon index -> list of all polygons inside it (at any depth)
+             parent_of_i -- array of shape (n,), index of the smallest polygon containing i, -1 if none
+             children_of_i -- dict, polygon index -> list of polygons directly inside it
+    """
+    n_poly = len(polygon_list)
+    tree = STRtree(polygon_list)
+    index_of = {id(poly):k for k, poly in enumerate(polygon_list)}
+    prepared = [None]*n_poly # prepared only when a polygon is a candidate container
+    areas = np.array([poly.area for poly in polygon_list])
+    
+    islands_of_i = {i:[] for i in range(n_poly)}
+    exclude_water = np.zeros((n_poly,))
+    parent_of_i = -np.ones((n_poly,), dtype=int)
+    for i_point in range(n_poly) :
+        point = point_list[i_point]
+        n = 0 # number of inside : a polygon inside 2 others is a pond inside an island in a lake
+        for i_polygon in _strtree_query(tree, point, index_of) :
+            if i_polygon == i_point : continue
+            if prepared[i_polygon] is None :
+                prepared[i_polygon] = prep(polygon_list[i_polygon])
+            if prepared[i_polygon].contains(point) :
+                n += 1
+                islands_of_i[i_polygon].append(i_point)
+                # containers are nested, so the smallest one is the direct parent
+                if parent_of_i[i_point] == -1 or areas[i_polygon] < areas[parent_of_i[i_point]] :
+                    parent_of_i[i_point] = i_polygon
+        if n%2 == 1 :
+            exclude_water[i_point] = 1
+    
+    children_of_i = {i:[] for i in range(n_poly)}
+    for i in range(n_poly) :
+        if parent_of_i[i] != -1 :
+            children_of_i[parent_of_i[i]].append(i)
+    return exclude_water, islands_of_i, parent_of_i, children_of_i
+
+class EdgeGeoCoding :
+    """
+    Pixel (row, column) to (lon, lat) mapping of a product, from the coordinates of its 4 edges.
+    Longitudes are linear along each row between the left and right edges, latitudes are linear along each column
+    between the top and bottom edges : the model of the x_mesh and y_mesh main-Polygons used to build.
+    Only the points asked for are computed, contour vertices for instance, no full-size mesh is needed.
+    """
+    def __init__(self, x_left, x_right, y_top, y_bottom) :
+        self.x_left = np.asarray(x_left, dtype=float)    # longitude of the first column, for each row
+        self.x_right = np.asarray(x_right, dtype=float)  # longitude of the last column, for each row
+        self.y_top = np.asarray(y_top, dtype=float)      # latitude of the first row, for each column
+        self.y_bottom = np.asarray(y_bottom, dtype=float)# latitude of the last row, for each column
+        self.h, self.w = len(self.x_left), len(self.y_top)
+
+    @classmethod
+    def from_boundary(cls, boundary, w, h) :
+        """
+        From the geo boundary of snappy.ProductUtils.createGeoBoundary(product, 1) : pixels of the edges, clockwise from the top left corner
+        """
+        boundary = list(boundary)
+        x_left = [coo.lon for coo in boundary[2*w+h-3:]] + [boundary[0].lon]
+        x_left.reverse()
+        x_right = [coo.lon for coo in boundary[w-1:w+h-1]]
+        y_top = [coo.lat for coo in boundary[:w]]
+        y_bottom = [coo.lat for coo in boundary[w+h-2:2*w+h-2]]
+        y_bottom.reverse()
+        return cls(x_left, x_right, y_top, y_bottom)
+
+    def to_dict(self) :
+        return {'x_left':self.x_left.tolist(), 'x_right':self.x_right.tolist(), 'y_top':self.y_top.tolist(), 'y_bottom':self.y_bottom.tolist()}
+
+    @classmethod
+    def from_dict(cls, dic) :
+        return cls(dic['x_left'], dic['x_right'], dic['y_top'], dic['y_bottom'])
+
+    def lon_lat(self, rows, cols) :
+        """
+        Longitudes and latitudes at fractional pixel coordinates, arrays of any shape
+        """
+        rows, cols = np.asarray(rows, dtype=float), np.asarray(cols, dtype=float)
+        left = np.interp(rows, np.arange(self.h), self.x_left)
+        right = np.interp(rows, np.arange(self.h), self.x_right)
+        top = np.interp(cols, np.arange(self.w), self.y_top)
+        bottom = np.interp(cols, np.arange(self.w), self.y_bottom)
+        return left + (right - left)*cols/(self.w-1), top + (bottom - top)*rows/(self.h-1)
+
+    def georeference(self, Segments) :
+        """
+        Segments in (column, row) pixel coordinates to segments in (lon, lat), all vertices transformed at once
+        """
+        if len(Segments) == 0 : return []
+        vertices = np.concatenate(Segments)
+        lon, lat = self.lon_lat(vertices[:, 1], vertices[:, 0])
+        splits = np.cumsum([len(seg) for seg in Segments])[:-1]
+        return np.split(np.column_stack((lon, lat)), splits)
+
+def simplify_segments(Segments, parent_of_i, tolerance_m):
+    """
+    Douglas-Peucker simplification of all segments with a tolerance in meters, converted with meters_to_latitude
+    (the same angle is used for longitudes, which is stricter than tolerance_m away from the equator).
+    Each polygon stays valid, and the nesting is kept : a polygon stays inside its parent and out of its siblings.
+    Polygons for which the simplification breaks it are kept as they were, with their parent or sibling.
+    
+    Output : new list of segments (closed np arrays of lon, lat)
+             n_vertices_before, n_vertices_after -- total number of vertices
+    """
+    tolerance = meters_to_latitude(tolerance_m)
+    n_poly = len(Segments)
+    polygons = [Polygon(seg) for seg in Segments]
+    simplified = []
+    for poly in polygons :
+        simple = poly.simplify(tolerance, preserve_topology=True)
+        simplified.append(simple if simple.geom_type == 'Polygon' and not simple.is_empty else poly)
+    
+    reverted = np.zeros(n_poly, dtype=bool)
+    while True :
+        tree = STRtree(simplified)
+        index_of = {id(poly):k for k, poly in enumerate(simplified)}
+        broken = set()
+        for i in range(n_poly) :
+            p = parent_of_i[i]
+            if p != -1 and not simplified[p].contains(simplified[i]) :
+                broken.update((i, p))
+            for j in _strtree_query(tree, simplified[i], index_of) :
+                if j > i and parent_of_i[j] == p and simplified[i].intersects(simplified[j]) :
+                    broken.update((i, j))
+        broken = [k for k in broken if not reverted[k]] # the original contours may already touch
+        if not broken : break
+        for k in broken :
+            simplified[k] = polygons[k]
+            reverted[k] = True
+    
+    new_segments = [np.asarray(poly.exterior.coords) for poly in simplified]
+    return new_segments, sum(len(seg) for seg in Segments), sum(len(seg) for seg in new_segments)
+
+def water_interior_points(Segments, exclude_water, children_of_i, tolerance=None):
+    """
+    One point in the water of each water polygon, its direct children (islands) being holes, for elevation sampling.
+    With tolerance = None the GEOS point on surface is used (in bulk with shapely 2), otherwise the pole of
+    inaccessibility, the water point farthest from the shores, found with the given tolerance (in degrees).
+    Both have a bounded cost per polygon. Exclude water polygons take their first vertex, their altitude doesn't matter.
+    
+    Output : elevation_points -- array of shape (n, 2), latitude, longitude of the points
+    """
+    n_poly = len(Segments)
+    elevation_points = np.zeros((n_poly, 2))
+    water = [i for i in range(n_poly) if not exclude_water[i]]
+    lakes = []
+    for i in water :
+        lake = Polygon(Segments[i], [Segments[c] for c in children_of_i[i]])
+        if not lake.is_valid : lake = lake.buffer(0) # touching islands, self-intersecting contours
+        lakes.append(lake)
+    if tolerance is None and hasattr(shapely, 'point_on_surface') : # shapely 2
+        points = shapely.point_on_surface(np.array(lakes, dtype=object))
+        lon_lat = shapely.get_coordinates(points)
+    else :
+        lon_lat = np.zeros((len(lakes), 2))
+        for k, lake in enumerate(lakes) :
+            point = lake.representative_point() if tolerance is None else polylabel(_largest_part(lake), tolerance)
+            lon_lat[k] = point.x, point.y
+    elevation_points[water] = lon_lat[:, ::-1]
+    for i in range(n_poly) :
+        if exclude_water[i] :
+            elevation_points[i] = [Segments[i][0,1], Segments[i][0,0]]
+    return elevation_points
+
+def _largest_part(geometry):
+    """
+    The polygon of largest area of a geometry which may be a MultiPolygon after buffer(0)
+    """
+    if geometry.geom_type == 'Polygon' : return geometry
+    return max(geometry.geoms, key=lambda part : part.area)
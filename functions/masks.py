@@ -0,0 +1,109 @@
+import numpy as np
+
+# =============================================================================
+# %% Packed masks
+# =============================================================================
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8) # set bits of each byte
+
+class PackedMask :
+    """
+    Boolean mask of shape (h, w) stored with np.packbits, 1 bit per pixel instead of 1 byte for a bool array
+    (8 bytes for the former int64 masks). Rows are packed separately, so that a strip of rows is a slice.
+    Bits after the last column of each row are always 0, so that count is the number of True pixels.
+    &, |, ^, ~ and count work on the packed bytes, without unpacking.
+    """
+    def __init__(self, bits, shape) :
+        self.bits = bits             # uint8 array of shape (h, ceil(w/8))
+        self.shape = tuple(shape)
+
+    @classmethod
+    def from_bool(cls, array) :
+        array = np.asarray(array, dtype=bool)
+        return cls(np.packbits(array, axis=-1), array.shape)
+
+    @classmethod
+    def zeros(cls, shape) :
+        return cls(np.zeros((shape[0], (shape[1] + 7)//8), dtype=np.uint8), shape)
+
+    @classmethod
+    def ones(cls, shape) :
+        return ~cls.zeros(shape)
+
+    def to_bool(self) :
+        return np.unpackbits(self.bits, axis=-1, count=self.shape[1]).view(bool)
+
+    def __array__(self, dtype=None, copy=None) :
+        return self.to_bool() if dtype is None else self.to_bool().astype(dtype)
+
+    @property
+    def nbytes(self) :
+        return self.bits.nbytes
+
+    def _padding(self) :
+        """
+        Bytes of the last column with the bits of actual pixels set, to clear the padding
+        """
+        n_pad = -self.shape[1] % 8
+        return np.uint8((0xFF << n_pad) & 0xFF)
+
+    def _operand(self, other) :
+        if isinstance(other, PackedMask) :
+            assert other.shape == self.shape, f"masks of shapes {self.shape} and {other.shape}"
+            return other.bits
+        return PackedMask.from_bool(np.broadcast_to(other, self.shape)).bits
+
+    def __and__(self, other) : return PackedMask(self.bits & self._operand(other), self.shape)
+    def __or__(self, other) : return PackedMask(self.bits | self._operand(other), self.shape)
+    def __xor__(self, other) : return PackedMask(self.bits ^ self._operand(other), self.shape)
+
+    def __iand__(self, other) :
+        self.bits &= self._operand(other)
+        return self
+
+    def __ior__(self, other) :
+        self.bits |= self._operand(other)
+        return self
+
+    def __invert__(self) :
+        bits = ~self.bits
+        if self.bits.shape[-1] : bits[:, -1] &= self._padding()
+        return PackedMask(bits, self.shape)
+
+    def __eq__(self, other) :
+        return isinstance(other, PackedMask) and self.shape == other.shape and np.array_equal(self.bits, other.bits)
+
+    def __getitem__(self, rows) :
+        """
+        Strip of rows : mask[y0:y1]
+        """
+        bits = self.bits[rows]
+        return PackedMask(bits, (len(bits), self.shape[1]))
+
+    def __setitem__(self, rows, value) :
+        self.bits[rows] = value.bits if isinstance(value, PackedMask) else np.packbits(np.asarray(value, dtype=bool), axis=-1)
+
+    def count(self) :
+        """
+        Number of True pixels
+        """
+        if hasattr(np, 'bitwise_count') : # numpy 2
+            return int(np.bitwise_count(self.bits).sum(dtype=np.int64))
+        return int(_POPCOUNT[self.bits].sum(dtype=np.int64))
+
+    def any(self) :
+        return bool(self.bits.any())
+
+    def save(self, path) :
+        """
+        Write the mask in path (.npz)
+        """
+        np.savez(path, bits=self.bits, shape=np.array(self.shape))
+
+    @classmethod
+    def load(cls, path) :
+        with np.load(path) as data :
+            return cls(data['bits'], data['shape'])
+
+    def __repr__(self) :
+        return f'PackedMask({self.shape[0]}x{self.shape[1]}, {self.count()} set, {self.nbytes/2**20:.1f} MB)'
@@ -0,0 +1,153 @@
+import numpy as np
+import xml.etree.ElementTree as ET
+from shapely.strtree import STRtree
+from shapely.prepared import prep
+from shapely.geometry import Point, Polygon
+from shapely.ops import unary_union
+
+from .geometry import _strtree_query, nest_polygons
+from .fsdata import lines_water_polygon, lines_exclude_water_polygon, write_fsdata
+
+# =============================================================================
+# %% Mosaic functions (merge of several tiles)
+# =============================================================================
+
+def read_fsdata(path):
+    """
+    Read back the polygons of a FSData xml written by main-Polygons, parsed in a stream.
+    Output : list of dicts with 'ring' (np array of lon, lat), 'exclusion' (bool), 'altitude' (float) and 'name'
+    """
+    polygons = []
+    for event, element in ET.iterparse(path, events=('end',)) :
+        if element.tag != 'Polygon' : continue
+        ring = _ring(element)
+        exclusion = any(a.get('name') == 'IsWaterExclusion' and a.get('value') == '1' for a in element.iter('Attribute'))
+        polygons.append({'ring':ring, 'exclusion':exclusion, 'altitude':float(element.get('altitude', 0)), 'name':element.get('displayName')})
+        element.clear()
+    return polygons
+
+def _ring(element):
+    return np.array([(float(v.get('lon')), float(v.get('lat'))) for v in element.iter('Vertex')])
+
+def read_main_exclusion(path, tail_size=2**16):
+    """
+    Ring (np array of lon, lat) of the Main Exclusion polygon of a FSData xml, the tile footprint.
+    fsdata_polygons and mosaic_fsdata write it last : only the end of the file is read, more of it if the polygon
+    is longer. Other files are streamed, no other polygon being built.
+    """
+    with open(path, 'rb') as f :
+        size = f.seek(0, 2)
+        while True :
+            f.seek(max(size - tail_size, 0))
+            tail = f.read().decode('utf-8', errors='ignore')
+            start = tail.rfind('<Polygon ')
+            if start >= 0 or tail_size >= size : break
+            tail_size *= 2
+    if start >= 0 and 'displayName="Main Exclusion"' in tail[start:tail.find('>', start)] :
+        return _ring(ET.fromstring(tail[start:tail.rfind('</Polygon>') + len('</Polygon>')]))
+    ring = None
+    for event, element in ET.iterparse(path, events=('end',)) :
+        if element.tag != 'Polygon' : continue
+        if element.get('displayName') == 'Main Exclusion' : ring = _ring(element)
+        element.clear()
+    assert ring is not None, f"no Main Exclusion polygon in {path}"
+    return ring
+
+def fsdata_water_areas(polygons):
+    """
+    Rebuild water areas from the polygons of one tile (read_fsdata, main exclusion removed) :
+    each water polygon with its direct exclusion children (islands) as holes. Ponds on islands are areas of their own.
+    Output : list of (shapely Polygon, altitude)
+    """
+    polygon_list = [Polygon(p['ring']) for p in polygons]
+    point_list = [Point(p['ring'][len(p['ring'])//2]) for p in polygons]
+    _, _, parent_of_i, children_of_i = nest_polygons(polygon_list, point_list)
+    areas = []
+    for i, p in enumerate(polygons) :
+        if p['exclusion'] : continue
+        holes = [polygons[c]['ring'] for c in children_of_i[i] if polygons[c]['exclusion']]
+        area = Polygon(p['ring'], holes)
+        if not area.is_valid : area = area.buffer(0)
+        areas.append((area, p['altitude']))
+    return areas
+
+def _polygon_parts(geometry):
+    if geometry.is_empty : return []
+    if geometry.geom_type == 'Polygon' : return [geometry]
+    return [part for part in getattr(geometry, 'geoms', []) if part.geom_type == 'Polygon']
+
+def _find(parent, k):
+    while parent[k] != k :
+        parent[k] = parent[parent[k]]
+        k = parent[k]
+    return k
+
+def mosaic_fsdata(paths, output_path, water_type=3):
+    """
+    Merge the FSData xml of several tiles into one. Sentinel-2 tiles overlap, so a lake cut at a tile border
+    or seen by two tiles has pieces in both : they are unioned. Only the water areas lying in the overlap with another
+    tile are kept in memory and indexed (STR-tree), the others are written as they are read, tile after tile.
+    Overlapping pieces are grouped with a union-find and each group is unioned on its own.
+    The main exclusions (tile footprints) are unioned into the main exclusion of the mosaic.
+    Output : dict with the number of tiles, written areas and merged groups
+    """
+    footprints = [Polygon(read_main_exclusion(path)) for path in paths] # end of each file only
+    footprint_tree = STRtree(footprints)
+    footprint_index = {id(f):k for k, f in enumerate(footprints)}
+
+    def direct_areas() :
+        """
+        Areas out of the overlaps are yielded at once, the others are kept in candidates
+        """
+        for k, path in enumerate(paths) :
+            polygons = [p for p in read_fsdata(path) if p['name'] != 'Main Exclusion']
+            neighbours = [j for j in _strtree_query(footprint_tree, footprints[k], footprint_index) if j != k]
+            overlap = prep(unary_union([footprints[j] for j in neighbours])) if neighbours else None
+            for area, altitude in fsdata_water_areas(polygons) :
+                if overlap is not None and overlap.intersects(area) :
+                    candidates.append((area, altitude))
+                else :
+                    yield area, altitude
+
+    def merged_areas() :
+        """
+        Overlapping candidates unioned group by group
+        """
+        tree = STRtree([area for area, _ in candidates])
+        index_of = {id(area):k for k, (area, _) in enumerate(candidates)}
+        parent = list(range(len(candidates)))
+        for k, (area, _) in enumerate(candidates) :
+            prepared = prep(area)
+            for j in _strtree_query(tree, area, index_of) :
+                if j > k and prepared.intersects(candidates[j][0]) :
+                    parent[_find(parent, j)] = _find(parent, k)
+        groups = {}
+        for k in range(len(candidates)) :
+            groups.setdefault(_find(parent, k), []).append(k)
+        stats['merged_groups'] = sum(len(group) > 1 for group in groups.values())
+        for group in groups.values() :
+            # the altitude of the largest piece is kept
+            altitude = candidates[max(group, key=lambda k : candidates[k][0].area)][1]
+            merged = unary_union([candidates[k][0] for k in group]) if len(group) > 1 else candidates[group[0]][0]
+            for part in _polygon_parts(merged) :
+                yield part, altitude
+
+    def fsdata_texts() :
+        group_index = 0
+        for areas in (direct_areas(), merged_areas()) :
+            for area, altitude in areas :
+                for part in _polygon_parts(area) :
+                    group_index += 1
+                    stats['areas'] += 1
+                    yield ''.join(lines_water_polygon(np.asarray(part.exterior.coords), group_index = group_index, altitude = altitude, water_type = water_type))
+                    for hole in part.interiors :
+                        group_index += 1
+                        yield ''.join(lines_exclude_water_polygon(np.asarray(hole.coords), group_index = group_index, water_type = water_type))
+        for part in _polygon_parts(unary_union(footprints)) :
+            group_index += 1
+            yield ''.join(lines_exclude_water_polygon(np.asarray(part.exterior.coords), group_index = group_index, name = 'Main Exclusion', water_type = -1))
+
+    candidates = []
+    stats = {'tiles':len(paths), 'areas':0, 'merged_groups':0}
+    write_fsdata(output_path, fsdata_texts())
+    return stats
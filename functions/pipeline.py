@@ -0,0 +1,161 @@
+from termcolor import colored
+import numpy as np
+import json
+import os
+from os.path import join
+from shapely.geometry import Point, Polygon
+
+from .general import profiler
+from .geometry import EdgeGeoCoding, nest_polygons, simplify_segments, water_interior_points
+from .raster import extract_contours, extract_contours_chunked
+from .fsdata import fsdata_polygons, write_fsdata
+
+# =============================================================================
+# %% Polygons pipeline (steps of main-Polygons)
+# =============================================================================
+
+def write_ndwi_npy(path, NDWI_combined, geocoding, corners, metadata={}, quantize=False, strip_h=1024):
+    """
+    Write the NDWI composite as path.npy, a raw array np.load/np.memmap can open without any JVM, and path.json,
+    a sidecar with the geo boundary (EdgeGeoCoding), the tile footprint corners (lon, lat) and metadata.
+    float32 by default, which read_ndwi_npy memory-maps without copy. With quantize, values are stored as int16
+    NDWI*10000 (2, no data, is 20000), half the size of float32, but read back into a float32 copy of the tile.
+    The array is written strip by strip.
+    """
+    h, w = NDWI_combined.shape
+    scale = 10000 if quantize else 1
+    out = np.lib.format.open_memmap(path + '.npy', mode='w+', dtype=np.int16 if quantize else np.float32, shape=(h, w))
+    for y0 in range(0, h, strip_h) :
+        strip = NDWI_combined[y0:y0+strip_h]
+        out[y0:y0+strip_h] = np.round(strip*scale) if quantize else strip
+    out.flush()
+    del out
+    sidecar = {'shape':[h, w], 'scale':scale, 'geocoding':geocoding.to_dict(), 'corners':np.asarray(corners).tolist()}
+    sidecar.update(metadata)
+    with open(path + '.json', 'w') as f :
+        json.dump(sidecar, f)
+
+def read_ndwi_npy(path):
+    """
+    Open the NDWI written by write_ndwi_npy. float32 files are memory-mapped copy-on-write (changes stay in memory),
+    int16 files are read and divided by their scale.
+    Output : NDWI_data, geocoding, corners_inbound (as read_ndwi_dim)
+    """
+    with open(path + '.json') as f :
+        sidecar = json.load(f)
+    data = np.load(path + '.npy', mmap_mode='c')
+    if sidecar['scale'] != 1 :
+        NDWI_data = np.empty(data.shape, dtype=np.float32)
+        np.divide(data, sidecar['scale'], out=NDWI_data, dtype=np.float32)
+    else :
+        NDWI_data = data
+    corners = np.array(sidecar['corners'])
+    center = np.average(corners, axis = 0)
+    corners_inbound = 99/100*corners + 1/100*center
+    return NDWI_data, EdgeGeoCoding.from_dict(sidecar['geocoding']), corners_inbound
+
+def read_ndwi(selected_tile, product_path='NDWI/'):
+    """
+    NDWI of a tile from NDWI/<tile>.npy when main-NDWI wrote it (no JVM), from NDWI/<tile>.dim otherwise
+    """
+    if os.path.exists(join(product_path, f'{selected_tile}.json')) :
+        return read_ndwi_npy(join(product_path, selected_tile))
+    from .snap_io import read_ndwi_dim
+    return read_ndwi_dim(selected_tile, product_path)
+
+def tile_contours(NDWI_data, geocoding, lvl=0, contour_workers=None):
+    """
+    Contours of NDWI_data at level lvl, georeferenced. A ring of earth (value = -1) is set in place on the border
+    of NDWI_data in order to avoid bugs of uncomplete lakes.
+    With contour_workers, the tile is cut in blocks contoured in parallel by contour_workers processes.
+    Output : list of segments (closed np arrays of lon, lat)
+    """
+    h, w = NDWI_data.shape
+    NDWI_data[0,0:w-1] = -1
+    NDWI_data[h-1, 0:w-1] = -1
+    NDWI_data[0:h-1, 0] = -1
+    NDWI_data[0:h-1, w-1] = -1
+    # contours are found in pixel coordinates, then only their vertices are georeferenced
+    if contour_workers is None :
+        Segments = extract_contours(NDWI_data, [lvl])[0]
+    else :
+        Segments = extract_contours_chunked(NDWI_data, [lvl], n_workers = contour_workers)[0]
+    return geocoding.georeference(Segments)
+
+def nest_segments(Segments, polygon_min_size=10):
+    """
+    Drop the segments of polygon_min_size vertices or less, then find water and exclude water polygons with nest_polygons.
+    Output : Segments kept, exclude_water, islands_of_i, parent_of_i, children_of_i
+    """
+    Segments = [seg for seg in Segments if len(seg) >= 3 and len(seg) > polygon_min_size]
+    point_list = []
+    polygon_list = []
+    for seg in Segments :
+        point_list.append(Point(seg[len(seg)//2])) # take a point in the middle of the segment avoids to take one on the external side
+        polygon_list.append(Polygon(seg))
+    return (Segments,) + nest_polygons(polygon_list, point_list)
+
+def tile_altitudes(Segments, exclude_water, children_of_i, elevation_source=None, pole_tolerance=None,
+                   dem_folder='DEM', cache_path='elevation_cache.sqlite', coalesce_radius_m=None):
+    """
+    Altitude of each polygon, sampled at a point in its water (islands are holes).
+    elevation_source : None (altitudes set to 0), 'opentopodata' (online, cached in cache_path) or 'dem' (offline, from dem_folder)
+    pole_tolerance : None for any point in the water, in degrees for the point the farthest from shores
+    coalesce_radius_m : None to request every point, in meters to request one point per group of points this close (opentopodata)
+    """
+    altitude_list = np.zeros((len(Segments),))
+    if elevation_source is None : return altitude_list
+    from .elevation import ElevationCache, get_multiple_elevation_opentopodata, get_multiple_elevation_coalesced, get_multiple_elevation_dem # requests only imported here
+    elevation_points = water_interior_points(Segments, exclude_water, children_of_i, tolerance = pole_tolerance) # latitude, longitude
+    water = np.flatnonzero(np.logical_not(exclude_water)) # altitudes of exclusion polygons don't matter : left to 0, not requested
+    elevation_points = elevation_points[water]
+    if elevation_source == 'opentopodata' :
+        elevation_cache = ElevationCache(cache_path, grid_m = 30) # kept between runs, only new points are requested
+        if coalesce_radius_m is None :
+            water_altitudes = get_multiple_elevation_opentopodata(elevation_points, cache = elevation_cache)
+        else :
+            water_altitudes, stats = get_multiple_elevation_coalesced(elevation_points, coalesce_radius_m, cache = elevation_cache)
+            print(colored('Elevation coalescing :', 'green'), f"{stats['points']} points, {stats['requested']} requested, {stats['requests_saved']} requests saved")
+        print(colored('Elevation cache :', 'green'), elevation_cache.stats())
+        elevation_cache.close()
+    elif elevation_source == 'dem' :
+        water_altitudes = get_multiple_elevation_dem(elevation_points, dem_folder = dem_folder)
+    else :
+        raise ValueError(f"unknown elevation_source {elevation_source}")
+    altitude_list[water] = np.nan_to_num(water_altitudes) # no elevation found
+    return altitude_list
+
+def process_polygons_tile(selected_tile, product_path='NDWI/', output_folder='Output', lvl=0, polygon_min_size=10,
+                          simplify_tolerance_m=None, elevation_source=None, pole_tolerance=None, contour_workers=None,
+                          profile_path=None, coalesce_radius_m=None):
+    """
+    All the steps of main-Polygons for one tile, from its .dim product to Output/<tile>.xml, without figures.
+    Each step is a span of profiler, with profile_path the spans (memory peaks included) are appended to this json lines file.
+    Output : dict with the duration of each step in seconds and the number of polygons
+    """
+    if profile_path is not None : profiler.trace_memory = True
+    with profiler.span('tile', tile=selected_tile) :
+        with profiler.span('read') :
+            NDWI_data, geocoding, corners_inbound = read_ndwi(selected_tile, product_path)
+        with profiler.span('contours') :
+            Segments = tile_contours(NDWI_data, geocoding, lvl, contour_workers)
+            del NDWI_data
+        with profiler.span('nesting') :
+            Segments, exclude_water, islands_of_i, parent_of_i, children_of_i = nest_segments(Segments, polygon_min_size)
+        if simplify_tolerance_m is not None :
+            with profiler.span('simplification') :
+                Segments, _, _ = simplify_segments(Segments, parent_of_i, simplify_tolerance_m)
+        profiler.count('polygons', len(Segments))
+        profiler.count('vertices', sum(len(seg) for seg in Segments))
+        with profiler.span('altitudes') :
+            altitude_list = tile_altitudes(Segments, exclude_water, children_of_i, elevation_source, pole_tolerance,
+                                           coalesce_radius_m = coalesce_radius_m)
+        with profiler.span('writing') :
+            polygons = fsdata_polygons(Segments, exclude_water, altitude_list, corners_inbound, water_type = 3)
+            write_fsdata(join(output_folder, f'{selected_tile}.xml'), polygons)
+    records = [record for record in profiler.records if record.get('tile') == selected_tile and record['depth'] == 1]
+    timings = {record['stage']:record['wall_s'] for record in records}
+    timings['n_poly'] = len(Segments)
+    if profile_path is not None : profiler.write_jsonl(profile_path)
+    else : profiler.records = []
+    return timings
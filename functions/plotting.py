@@ -0,0 +1,97 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib import cm
+from matplotlib.colors import ListedColormap
+
+# =============================================================================
+# %% Plotting functions
+# =============================================================================
+
+def land_water_cmap(threshold=0) :
+    """
+    Create a blue/green colormap of 256 values with a clear limit between green and blues.
+    This limit is located at threshold for values going from -1 to 1.
+    """
+    Blues = cm.get_cmap('Blues', 256)
+    Greens = cm.get_cmap('Greens', 256)
+    newcolors = Blues(np.linspace(0, 1, 256))
+    new_greens = Greens(np.linspace(0, 1, 256))
+    lim = int(256 + 256*(threshold-1)/2)
+    newcolors[:lim, :] = np.flip(new_greens[256-lim:256, :], axis = 0)
+    newcmp = ListedColormap(newcolors)
+    return newcmp
+
+def output_view(product, band_names, minima=None, maxima=None):
+    '''
+    Creates visualization of product data
+    
+    Keyword arguments:
+    product       -- snappy GPF product --> input Sentinel-1 product 
+    band          -- List --> product's band to be visualized
+    minima        -- List --> minimum values for each band, for visualisation
+    maxima        -- List --> maximum values for each band, for visualisation
+    '''
+    band_data_list = []
+    n = len(band_names)
+    if minima == None : minima = [None]*n 
+    if maxima == None : maxima = [None]*n
+    assert len(minima) == n, "minima has not the required number of elements"
+    assert len(maxima) == n, "maxima has not the required number of elements"
+    
+    for i in band_names:
+        band = product.getBand(i)
+        w = band.getRasterWidth()
+        h = band.getRasterHeight()
+        band_data = np.zeros(w * h, np.float32)
+        band.readPixels(0, 0, w, h, band_data)
+        band_data.shape = h, w
+        band_data_list.append(band_data)
+    
+    n_rows = (n+1)//2
+    fig, ax = plt.subplots(n_rows,min(n,2), figsize=(min(n,2)*9,9)) # (length, height)
+    if n == 1 :
+        ax = [ax]
+    if n > 2 :
+        ax1 = []
+        for i in range(n_rows) :
+            for j in range(2) :
+                ax1.append(ax[i][j])
+        ax = ax1
+    for i in range(n) :
+        ax[i].imshow(band_data_list[i], cmap='gray', vmin=minima[i] , vmax=maxima[i])
+        ax[i].set_title(band_names[i])
+        
+    
+    for ax in fig.get_axes():
+        ax.label_outer()
+    plt.tight_layout()
+
+def output_RGB(product, RGB_band_names):
+    '''
+    Creates visualization of product data in RGB
+    
+    Keyword arguments:
+    product       -- snappy GPF product --> input Sentinel-1 product 
+    band          -- List --> 3 product's band to be visualized in order RGB
+    minima        -- List --> minimum values for each band, for visualisation
+    maxima        -- List --> maximum values for each band, for visualisation
+    '''
+    assert len(RGB_band_names)==3, 'There must be 3 bands'
+    RGB_bands = []
+    for i, band_name in enumerate(RGB_band_names):
+        band = product.getBand(band_name)
+        if i == 0 :
+            w = band.getRasterWidth()
+            h = band.getRasterHeight()
+        color_band = np.zeros(w*h, np.float32)
+        band.readPixels(0, 0, w, h, color_band)
+        min_color = min(color_band); max_color = max(color_band)
+        RGB_bands.append((color_band-min_color)/(max_color-min_color)) # put the image on 0 to 1 scale
+    
+    RGB = np.dstack(RGB_bands)
+    RGB.shape = h, w, 3
+    
+    fig, ax = plt.subplots(1,1, figsize=(10,10)) # (length, height)
+    ax.imshow(RGB)
+    ax.set_title('RGB')
+    plt.tight_layout()
@@ -0,0 +1,136 @@
+from termcolor import colored
+import numpy as np
+import sqlite3
+import xml.etree.ElementTree as ET
+from zipfile import ZipFile
+import os
+from os.path import join
+from glob import iglob
+
+# =============================================================================
+# %% Product files functions
+# =============================================================================
+
+def read_zip_name(name, display=False):
+    # first get rid of path and '.zip'
+    name = name.strip('.zip').split('\\')[-1]
+    dic = {}
+    
+    #gather first data
+    dic['mission id'] = mission_id = name.split('_')[0]
+    if 'S1' in dic['mission id'] :
+        mission_id, mode_beam, x1, x2, d1, d2, n_orbit_abs, mission_datatake, ID = name.split('_')
+        prod_type = x1[:3]
+        res_class = x1[3:]
+        processing_lvl = x2[0]
+        prod_class = x2[1]
+        polarization = x2[2:]
+        if display :
+            print(
+                colored('Mission identifier : ', 'cyan') + f'{mission_id}\n' +
+                colored('Mode beam : ', 'cyan') + {'IW':'Interferometric wide (IW)', 'SM':'S1-6 (SM)', 'EW':'EW', 'WW':'WW'}[mode_beam] + '\n' + 
+                colored('Product type : ', 'cyan') + "{}\n".format({'SLC':'Single look complex (SLC)', 'GRD':'Ground range detection (GRD)', 'OCN':'OCN'}[prod_type]) +
+                colored('Resolution class : ', 'cyan') + f'{res_class}\n'*(prod_type=='GRD') +
+                colored('Processing level : ', 'cyan') + f'{processing_lvl}\n' +
+                colored('Product class : ', 'cyan') + '{}\n'.format({'S':'Standard (S)', 'A':'Annotation (A)'}[prod_class]) +
+                colored('Polarization : ', 'cyan') + {'SH':'Single HH', 'SV':'Single VV', 'DH':'Dual HH+HV', 'DV':'Dual VV+VH'}[polarization] + '\n' +
+                colored('Starting date : ', 'cyan') + '{}/{}/{} at {}:{}:{}\n'.format(d1[6:8], d1[4:6], d1[:4], d1[9:11], d1[11:13], d1[13:]) +
+                colored('Ending date : ', 'cyan') + '{}/{}/{} at {}:{}:{}\n'.format(d2[6:8], d2[4:6], d2[:4], d2[9:11], d2[11:13], d2[13:]) +
+                colored('Absolute orbit number : ', 'cyan') + '{}\n'.format(int(n_orbit_abs)) +
+                colored('Mission data-take : ', 'cyan') + f'{mission_datatake}\n' +
+                colored('Product unique ID : ', 'cyan') + f'{ID}'
+                )
+        return mission_id, mode_beam, prod_type, res_class, processing_lvl, prod_class, polarization, d1, d2, n_orbit_abs, mission_datatake, ID
+    if 'S2' in dic['mission id'] :
+        mission_id, prod_lvl, date, proc_bl, rel_orbit, tile_num, d2 = name.split('_')
+        if display :
+            print(
+                colored('Mission identifier : ', 'cyan') + f'{mission_id}\n' +
+                colored('Product level : ', 'cyan') + "{}\n".format({'MSIL1C':'Level-1C','MSIL2A':'Level-2A','MSIL2Ap':'Level-2Ap'}[prod_lvl]) +
+                colored('Starting date : ', 'cyan') + '{}/{}/{} at {}:{}:{}\n'.format(date[6:8], date[4:6], date[0:4], date[9:11], date[11:13], date[13:]) +
+                colored('Processing baseline number : ', 'cyan') + '{}\n'.format(proc_bl) +
+                colored('Relative orbit number : ', 'cyan') + '{}\n'.format(int(rel_orbit[1:])) +
+                colored('Tile number : ', 'cyan') + f'{tile_num}\n' +
+                colored('Ingestion Date : ', 'cyan') + '{}/{}/{} at {}:{}:{}\n'.format(d2[6:8], d2[4:6], d2[0:4], d2[9:11], d2[11:13], d2[13:])
+                )
+        return name.split('_')
+
+def read_mtd_metadata(zip_path):
+    """
+    Light metadata of a Sentinel-2 zip read from its MTD_MSIL*.xml, without extracting the zip
+    Output : dict with 'level', 'cloud_pct', 'snow_pct' and 'footprint' (WKT polygon, lon lat), None when not found
+    """
+    metadata = {'level':None, 'cloud_pct':None, 'snow_pct':None, 'footprint':None}
+    with ZipFile(zip_path) as archive :
+        mtd = [name for name in archive.namelist() if name.split('/')[-1].startswith('MTD_MSIL') and name.count('/') == 1]
+        if not mtd : return metadata
+        root = ET.fromstring(archive.read(mtd[0]))
+    for element in root.iter() :
+        tag = element.tag.split('}')[-1]
+        if tag == 'PROCESSING_LEVEL' : metadata['level'] = element.text
+        elif tag == 'Cloud_Coverage_Assessment' : metadata['cloud_pct'] = float(element.text)
+        elif tag == 'SNOW_ICE_PERCENTAGE' : metadata['snow_pct'] = float(element.text)
+        elif tag == 'EXT_POS_LIST' and metadata['footprint'] is None :
+            lat_lon = np.array(element.text.split(), dtype=float).reshape(-1, 2)
+            metadata['footprint'] = 'POLYGON((' + ','.join(f'{lon} {lat}' for lat, lon in lat_lon) + '))'
+    return metadata
+
+class ProductCatalog :
+    """
+    SQLite index of the Sentinel-2 zips of a folder : name fields (read_zip_name) and MTD metadata.
+    update only opens the zips added or modified since the last update, products_for_tile answers from the index.
+    """
+    def __init__(self, path='Original/catalog.sqlite') :
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS products (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, mission TEXT, '
+                        'product_level TEXT, processing_level TEXT, sensing_date TEXT, baseline TEXT, relative_orbit TEXT, '
+                        'tile TEXT, cloud_pct REAL, snow_pct REAL, footprint TEXT)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS products_tile ON products (tile, sensing_date)')
+        self.db.commit()
+
+    def update(self, product_path='Original/', pattern='S2*_T*.zip') :
+        """
+        Index new and modified zips, forget deleted ones. Output : number of zips (re)indexed, number forgotten
+        """
+        known = dict(self.db.execute('SELECT path, mtime FROM products'))
+        paths = sorted(iglob(join(product_path, pattern), recursive=True))
+        n_indexed = 0
+        for path in paths :
+            mtime = os.path.getmtime(path)
+            if known.get(path) == mtime : continue
+            mission, product_level, date, baseline, rel_orbit, tile, _ = read_zip_name(os.path.basename(path))
+            metadata = read_mtd_metadata(path)
+            self.db.execute('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (path, mtime, os.path.getsize(path), mission, product_level, metadata['level'], date, baseline,
+                             rel_orbit, tile, metadata['cloud_pct'], metadata['snow_pct'], metadata['footprint']))
+            n_indexed += 1
+        deleted = set(known) - set(paths)
+        self.db.executemany('DELETE FROM products WHERE path=?', [(path,) for path in deleted])
+        self.db.commit()
+        return n_indexed, len(deleted)
+
+    def products_for_tile(self, tile, max_cloud_pct=None, date_min=None, date_max=None) :
+        """
+        Paths of the products of a tile, by sensing date. Dates are written as in product names : YYYYMMDDTHHMMSS
+        """
+        query = 'SELECT path FROM products WHERE tile=?'
+        parameters = [tile]
+        if max_cloud_pct is not None :
+            query += ' AND cloud_pct <= ?'; parameters.append(max_cloud_pct)
+        if date_min is not None :
+            query += ' AND sensing_date >= ?'; parameters.append(date_min)
+        if date_max is not None :
+            query += ' AND sensing_date <= ?'; parameters.append(date_max)
+        return [path for path, in self.db.execute(query + ' ORDER BY sensing_date, path', parameters)]
+
+    def versions(self, paths) :
+        """
+        Output : dict path -> (mtime, size) of the zips indexed among paths
+        """
+        versions = {}
+        for path, mtime, size in self.db.execute('SELECT path, mtime, size FROM products') :
+            versions[path] = mtime, size
+        return {path:versions[path] for path in paths if path in versions}
+
+    def close(self) :
+        self.db.close()
@@ -0,0 +1,325 @@
+import numpy as np
+import json
+import os
+from os.path import join
+from concurrent.futures import ProcessPoolExecutor
+
+from .masks import PackedMask
+
+# =============================================================================
+# %% Raster functions
+# =============================================================================
+
+def _closed_lines(generator, level):
+    """
+    Lines of a contourpy generator at level, the closed ones ending with their first vertex whatever the algorithm
+    ('mpl2014' doesn't repeat it, and only gives lines with their codes)
+    """
+    lines = []
+    for points, codes in zip(*generator.lines(level)) :
+        if codes[-1] == 79 and (points[0] != points[-1]).any() : # CLOSEPOLY
+            points = np.vstack((points, points[:1]))
+        lines.append(points)
+    return lines
+
+def extract_contours(array, levels=(0,), x=None, y=None, algorithm='serial'):
+    """
+    Isolines of a 2D array at each level, computed by contourpy directly : no matplotlib figure or backend involved.
+    Vertices are (column, row) pixel coordinates, or are taken from the 2D arrays x and y as plt.contour does.
+    'serial' gives the same rings as 'mpl2014', the algorithm of the former plt.contour (bench_contours checks it).
+    Lines not touching the border of the array are closed rings (their last vertex is the first one).
+    
+    Output : list with for each level a list of np arrays of shape (n_vertices, 2)
+    """
+    import contourpy
+    generator = contourpy.contour_generator(x, y, array, name=algorithm, line_type='SeparateCode')
+    return [_closed_lines(generator, level) for level in levels]
+
+def _block_contours(block, r0, c0, levels, algorithm):
+    """
+    Contours of a block of a larger array, in the pixel coordinates of the whole array
+    """
+    import contourpy
+    x = np.arange(c0, c0 + block.shape[1], dtype=float)
+    y = np.arange(r0, r0 + block.shape[0], dtype=float)
+    generator = contourpy.contour_generator(x, y, block, name=algorithm, line_type='SeparateCode')
+    return [_closed_lines(generator, level) for level in levels]
+
+def _stitch_fragments(lines):
+    """
+    Join the lines of blocks which end on a block border into whole lines.
+    Lines keep the orientation of the contour algorithm, so the end of a fragment is the start of the next one.
+    """
+    if not lines : return []
+    key = lambda point : (round(float(point[0]), 9), round(float(point[1]), 9))
+    # rings inside a block are closed exactly, the comparison is done at once on all the lines
+    is_ring = np.isclose([line[0] for line in lines], [line[-1] for line in lines], rtol=0, atol=1e-9).all(axis=1)
+    closed = [line for line, ring in zip(lines, is_ring) if ring]
+    fragments = [line for line, ring in zip(lines, is_ring) if not ring]
+    by_start = {}
+    for k, fragment in enumerate(fragments) :
+        by_start.setdefault(key(fragment[0]), []).append(k)
+    ends = {key(fragment[-1]) for fragment in fragments}
+    used = np.zeros(len(fragments), dtype=bool)
+    # lines touching the array border first start where no fragment ends, then the rings
+    order = [k for k in range(len(fragments)) if key(fragments[k][0]) not in ends]
+    order += [k for k in range(len(fragments)) if key(fragments[k][0]) in ends]
+    for k in order :
+        if used[k] : continue
+        used[k] = True
+        chain = [fragments[k]]
+        while key(chain[-1][-1]) != key(chain[0][0]) :
+            following = [j for j in by_start.get(key(chain[-1][-1]), []) if not used[j]]
+            if not following : break # the line ends on the array border
+            used[following[0]] = True
+            chain.append(fragments[following[0]])
+        closed.append(np.concatenate([chain[0]] + [fragment[1:] for fragment in chain[1:]]))
+    return closed
+
+def extract_contours_chunked(array, levels=(0,), block_size=2048, n_workers=None, algorithm='serial'):
+    """
+    Same as extract_contours (in pixel coordinates), with the array cut in blocks contoured by a pool of n_workers processes.
+    Blocks share their border row and column, so that every cell belongs to one block and lines cross block borders
+    at the same points in both blocks : fragments are stitched back into the lines of a whole-array run.
+    
+    Output : list with for each level a list of np arrays of shape (n_vertices, 2)
+    """
+    h, w = array.shape
+    blocks = [(r0, c0) for r0 in range(0, max(h-1, 1), block_size) for c0 in range(0, max(w-1, 1), block_size)]
+    with ProcessPoolExecutor(max_workers=n_workers) as executor :
+        futures = [executor.submit(_block_contours, array[r0:r0+block_size+1, c0:c0+block_size+1], r0, c0, levels, algorithm)
+                   for r0, c0 in blocks]
+        results = [future.result() for future in futures]
+    return [_stitch_fragments([line for result in results for line in result[k]]) for k in range(len(levels))]
+
+def _runs(flags):
+    """
+    (start, stop) of the runs of True of a 1D boolean array
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], flags.view(np.int8), [0]))))
+    return zip(edges[::2], edges[1::2])
+
+def _hidden_boxes(hidden):
+    """
+    Bounding boxes (r0, r1, c0, c1) of groups of hidden pixels, cut along the rows and columns having no hidden pixel
+    until no box can be cut anymore : pixels of two boxes are never 4-neighbours, so that boxes can be filled separately.
+    """
+    boxes = []
+    stack = [(0, hidden.shape[0], 0, hidden.shape[1])]
+    while stack :
+        r0, r1, c0, c1 = stack.pop()
+        sub = hidden[r0:r1, c0:c1]
+        row_runs = list(_runs(sub.any(axis=1)))
+        col_runs = list(_runs(sub.any(axis=0)))
+        if len(row_runs) == 1 and len(col_runs) == 1 :
+            (a, b), (c, d) = row_runs[0], col_runs[0]
+            boxes.append((r0+a, r0+b, c0+c, c0+d))
+        elif len(row_runs) > 1 :
+            stack += [(r0+a, r0+b, c0, c1) for a, b in row_runs]
+        else :
+            stack += [(r0, r1, c0+c, c0+d) for c, d in col_runs]
+    return boxes
+
+def _fill_box(array, hidden, min_neighbours):
+    """
+    Fronts of fill_hidden_pixels on one box (views of array and hidden, with a margin of known pixels).
+    Only the front is computed : the hidden pixels having a known neighbour, kept as flat indices of the box
+    padded by 1 pixel, and updated with the hidden neighbours of the pixels just set.
+    Output : number of fronts
+    """
+    h, w = array.shape
+    W = w + 2
+    known = np.zeros((h+2, W), dtype=bool)
+    known[1:-1, 1:-1] = ~hidden
+    values = np.zeros((h+2, W), dtype=float)
+    values[1:-1, 1:-1] = np.where(hidden, 0, array)
+    known, values, hidden = known.ravel(), values.ravel(), np.pad(hidden, 1).ravel() # the padding is neither known nor to fill
+    offsets = np.array([-W, W, -1, 1])
+    front = np.flatnonzero(hidden)
+    front = front[known[front[:, None] + offsets].any(axis=1)]
+    n_fronts = 0
+    while len(front) :
+        neighbours = front[:, None] + offsets
+        div = known[neighbours].sum(axis=1)
+        to_set = div >= min_neighbours
+        if not to_set.any() :
+            if min_neighbours == 1 : break # no known pixel left to propagate
+            min_neighbours = 1
+            continue
+        new = front[to_set]
+        values[new] = (values[neighbours[to_set]]*known[neighbours[to_set]]).sum(axis=1)/div[to_set]
+        known[new] = True
+        n_fronts += 1
+        following = (new[:, None] + offsets).ravel()
+        front = np.unique(np.concatenate((front[~to_set], following[hidden[following] & ~known[following]])))
+    filled = (hidden & known).reshape(h+2, W)[1:-1, 1:-1]
+    array[filled] = values.reshape(h+2, W)[1:-1, 1:-1][filled]
+    return n_fronts
+
+def fill_hidden_pixels(array, hidden, min_neighbours=2):
+    """
+    Fill the pixels where hidden is True with the average of their known 4-neighbours, front after front.
+    A pixel is set once at least min_neighbours of its neighbours are known, when no pixel of its box can be set
+    the condition is relaxed to 1 neighbour (as the former pixel by pixel loop of main-NDWI).
+    Hidden pixels are split in independent boxes (_hidden_boxes), each front is computed on the bounding box
+    of the remaining hidden pixels of its box : a front costs the size of one cloud, not of the whole tile.
+
+    Output : array -- filled in place
+             n_fronts -- number of fronts needed (the most of all boxes)
+    """
+    h, w = array.shape
+    hidden = np.array(hidden, dtype=bool) # copy
+    n_fronts = 0
+    for r0, r1, c0, c1 in _hidden_boxes(hidden) :
+        r0, r1, c0, c1 = max(r0-1, 0), min(r1+1, h), max(c0-1, 0), min(c1+1, w) # margin of known pixels
+        n_fronts = max(n_fronts, _fill_box(array[r0:r1, c0:c1], hidden[r0:r1, c0:c1], min_neighbours))
+    return array, n_fronts
+
+def _product_terms(NDWI_data, Cloud_data, Classification_data, max_tolerable_cloud_proba_percent=20):
+    """
+    Contribution of one product (or a strip of it) to the composite.
+    Output : NDWI_term and weight to add to the NDWI and weight sums, known (the product has data)
+             and visible (known and not too cloudy) boolean arrays
+    """
+    Cloud_mask = Cloud_data > max_tolerable_cloud_proba_percent # True where there are too much clouds
+    known = Classification_data != 0 # True when there is data
+    weight = (1-np.minimum(Cloud_data/max_tolerable_cloud_proba_percent, 1)) * known
+    return NDWI_data * weight, weight, known, known & ~Cloud_mask
+
+def composite_ndwi(read_strip, n_prod, w, h, max_tolerable_cloud_proba_percent=20, strip_h=None):
+    """
+    Combine the NDWI of n_prod products covering the same tile, weighted by cloud confidence and coverage.
+    read_strip(i, y0, n_rows) returns the NDWI, cloud confidence and scene classification arrays of product i,
+    of shape (n_rows, w) starting at row y0. Products are read strip by strip, so that only strip_h rows
+    of each product are in memory at a time. strip_h = None reads the whole tile at once.
+
+    Output : NDWI_combined -- array of shape (h, w), 2 where no product gives data
+             Cloud_sum -- array of shape (h, w), sum of the weights of all products
+             Hidden_zone -- PackedMask of shape (h, w), True where the pixel is always covered by clouds or not covered at all
+             Covered -- PackedMask of shape (h, w), True where at least one product has data
+    """
+    if strip_h is None : strip_h = h
+    NDWI_combined = np.zeros((h, w), dtype=float) + 2
+    Cloud_sum = np.zeros((h, w), dtype=np.float32)
+    Hidden_zone = PackedMask.ones((h, w))
+    Covered = PackedMask.zeros((h, w))
+    for y0 in range(0, h, strip_h) :
+        y1 = min(y0 + strip_h, h)
+        NDWI_sum = np.zeros((y1-y0, w), dtype=np.float32)
+        for i in range(n_prod) :
+            NDWI_term, weight, known, visible = _product_terms(*read_strip(i, y0, y1-y0), max_tolerable_cloud_proba_percent)
+            NDWI_sum += NDWI_term
+            Cloud_sum[y0:y1] += weight
+            Covered[y0:y1] |= known
+            Hidden_zone[y0:y1] &= ~visible
+        np.divide(NDWI_sum, Cloud_sum[y0:y1], out=NDWI_combined[y0:y1], where=Cloud_sum[y0:y1]!=0)
+    return NDWI_combined, Cloud_sum, Hidden_zone, Covered
+
+class CompositeState :
+    """
+    Accumulators of the composite of a tile, saved with the list of the products they include, so that a product
+    can be folded in, or subtracted out, without reading the others again.
+    The known and visible masks of each product are kept packed (masks[path]) and saved with the state :
+    Covered and Hidden_zone are combined from them, and a removed product's masks are just dropped.
+    The version of each product, [mtime, size] of its zip, tells a zip replaced under the same name.
+    The counter of products with a weight sets the sums back to zero where no product is left.
+    """
+    arrays = ('NDWI_sum', 'Cloud_sum', 'n_weighted')
+
+    def __init__(self, h, w, max_tolerable_cloud_proba_percent=20) :
+        self.NDWI_sum = np.zeros((h, w), dtype=np.float32)
+        self.Cloud_sum = np.zeros((h, w), dtype=np.float32)
+        self.n_weighted = np.zeros((h, w), dtype=np.uint8)
+        self.products = [] # paths of the products included
+        self.masks = {} # path -> known, visible PackedMask of the product
+        self.versions = {} # path -> [mtime, size] of the zip when it was folded in
+        self.max_tolerable_cloud_proba_percent = max_tolerable_cloud_proba_percent
+
+    def fold(self, read_strip, i, path, sign=1, strip_h=None, version=None) :
+        """
+        Add (sign = 1) or subtract (sign = -1) product i of read_strip, whose file is path.
+        version : (mtime, size) of the file added, as given by ProductCatalog.versions
+        """
+        h, w = self.NDWI_sum.shape
+        if strip_h is None : strip_h = h
+        product_known, product_visible = PackedMask.zeros((h, w)), PackedMask.zeros((h, w))
+        for y0 in range(0, h, strip_h) :
+            y1 = min(y0 + strip_h, h)
+            NDWI_term, weight, known, visible = _product_terms(*read_strip(i, y0, y1-y0), self.max_tolerable_cloud_proba_percent)
+            self.NDWI_sum[y0:y1] += sign*NDWI_term
+            self.Cloud_sum[y0:y1] += sign*weight
+            # uint8 counter, -1 is added as 255 modulo 256 : adding then subtracting a product gives them back exactly
+            self.n_weighted[y0:y1] += np.uint8(sign % 256)*(weight > 0)
+            if sign == 1 :
+                product_known[y0:y1] = known
+                product_visible[y0:y1] = visible
+        if sign == 1 :
+            self.products.append(path)
+            self.masks[path] = product_known, product_visible
+            self.versions[path] = None if version is None else list(version)
+        else :
+            self.products.remove(path)
+            self.masks.pop(path, None)
+            self.versions.pop(path, None)
+        # where no product is left, sums are set back to exact zeros instead of rounding residues
+        self.NDWI_sum[self.n_weighted == 0] = 0
+        self.Cloud_sum[self.n_weighted == 0] = 0
+
+    def result(self) :
+        """
+        Output : NDWI_combined, Cloud_sum, Hidden_zone, Covered as composite_ndwi
+        """
+        NDWI_combined = np.zeros(self.NDWI_sum.shape, dtype=float) + 2
+        np.divide(self.NDWI_sum, self.Cloud_sum, out=NDWI_combined, where=self.n_weighted > 0)
+        Covered, Visible = PackedMask.zeros(self.NDWI_sum.shape), PackedMask.zeros(self.NDWI_sum.shape)
+        for known, visible in self.masks.values() :
+            Covered |= known
+            Visible |= visible
+        return NDWI_combined, self.Cloud_sum.copy(), ~Visible, Covered
+
+    def _mask_paths(self, folder, path) :
+        name = os.path.basename(path)
+        return join(folder, 'masks', f'{name}.known.npz'), join(folder, 'masks', f'{name}.visible.npz')
+
+    def save(self, folder) :
+        os.makedirs(folder, exist_ok=True)
+        for name in self.arrays :
+            np.save(join(folder, f'{name}.npy'), getattr(self, name))
+        os.makedirs(join(folder, 'masks'), exist_ok=True)
+        kept = set()
+        for path, masks in self.masks.items() :
+            for mask, mask_path in zip(masks, self._mask_paths(folder, path)) :
+                mask.save(mask_path)
+                kept.add(os.path.basename(mask_path))
+        for file_name in os.listdir(join(folder, 'masks')) :
+            if file_name not in kept : os.remove(join(folder, 'masks', file_name)) # removed products
+        with open(join(folder, 'manifest.json'), 'w') as f :
+            json.dump({'products':self.products, 'versions':self.versions,
+                       'max_tolerable_cloud_proba_percent':self.max_tolerable_cloud_proba_percent}, f, indent=1)
+
+    @classmethod
+    def load(cls, folder) :
+        with open(join(folder, 'manifest.json')) as f :
+            manifest = json.load(f)
+        state = cls(0, 0, manifest['max_tolerable_cloud_proba_percent'])
+        for name in cls.arrays :
+            setattr(state, name, np.load(join(folder, f'{name}.npy')))
+        state.products = manifest['products']
+        state.versions = manifest.get('versions', {}) # states saved without versions : every product is seen as changed
+        for path in state.products :
+            mask_paths = state._mask_paths(folder, path)
+            if not all(os.path.exists(mask_path) for mask_path in mask_paths) : # state saved before the masks
+                state.products, state.masks = [], {} # main-NDWI then combines all products again
+                break
+            state.masks[path] = tuple(PackedMask.load(mask_path) for mask_path in mask_paths)
+        return state
+
+def ndwi_formula(B3, B8):
+    """
+    NDWI of the SNAP BandMaths expression of main-NDWI, on whole arrays in float32 :
+    if (B3<=0 and B8<=0) then 1 else (max(0,B3) - max(0,B8))/(max(0,B3) + max(0,B8))
+    """
+    B3 = np.maximum(B3, 0, dtype=np.float32)
+    B8 = np.maximum(B8, 0, dtype=np.float32)
+    total = B3 + B8
+    return np.divide(B3 - B8, total, out=np.ones(total.shape, dtype=np.float32), where=total>0)
@@ -0,0 +1,227 @@
+from termcolor import colored
+import requests
+import time
+import threading
+import hashlib
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from zipfile import ZipFile, BadZipFile
+import os
+from os.path import join
+
+from .elevation import TokenBucket, http_session, get_with_retry
+
+# =============================================================================
+# %% Copernicus Open Access Hub functions (search and download)
+# =============================================================================
+
+_ATOM = '{http://www.w3.org/2005/Atom}'
+
+_OPENSEARCH = '{http://a9.com/-/spec/opensearch/1.1/}'
+
+_search_cache = {}
+
+_search_cache_lock = threading.Lock()
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _search_page(url, params, session, auth=None, max_retries=5):
+    """
+    Request one page of OpenSearch results and parse its entries one by one while the response is read.
+    Output : totalResults, list of entries (title, href, {name: value} of the <double> fields), (code, message) of an error feed or None
+    """
+    response = get_with_retry(url, params, session=session, max_retries=max_retries, auth=auth, stream=True)
+    response.raw.decode_content = True # gzip
+    n_prod, entries, error = 0, [], None
+    for _, element in ET.iterparse(response.raw) :
+        if element.tag == _OPENSEARCH + 'totalResults' :
+            n_prod = int(element.text)
+        elif element.tag == _ATOM + 'entry' :
+            link = element.find(_ATOM + 'link')
+            doubles = {double.get('name'):float(double.text) for double in element.iter(_ATOM + 'double')}
+            entries.append((element.findtext(_ATOM + 'title'), link.get('href') if link is not None else None, doubles))
+            element.clear()
+        elif _local_name(element.tag) == 'error' :
+            fields = {_local_name(child.tag):child.text for child in element}
+            error = (fields.get('code'), fields.get('message'))
+    response.close()
+    return n_prod, entries, error
+
+def search_online_prod(filename = "*", footprint=[], max_cloudcoverpercentage = 20, username="ybau", password="Copernicus.city7",
+                       url='https://scihub.copernicus.eu/dhus/search', rows=100, n_workers=4, cache_ttl=600, max_retries=5):
+    """
+    Returns product names corresponding to the search
+    See https://scihub.copernicus.eu/userguide/OpenSearchAPI for more details
+    No ice or snow tolerated on pictures : snowicepercentage == 0
+    The first page gives the number of results, the other pages are then requested by n_workers threads.
+    The entries of a query are kept cache_ttl seconds, so a new search with another max_cloudcoverpercentage is not requested again.
+    
+    Keyword arguments:
+    filename    -- string --> filename of the product, can be written with * and ?.
+    footprint   -- list --> list of points (1, 3 or more) which must be intersected by the images. 0 point means ignoring this parameter
+        example : footprint = [(41.9, 12.5)] 
+        !!! Latitude, Longitude format !!!
+    max_cloudcoverpercentage --float --> maximum tolerable cloud coverage in percent
+    Output : dict name -> download link
+    """
+    
+    assert (len(footprint) != 2), "more than 2 points are required to create a polygon"
+    if len(footprint) == 0 : footprinturl = "*"
+    elif len(footprint) == 1 : footprinturl = f"{footprint[0][0]},{footprint[0][1]}"
+    else :
+        footprinturl = "POLYGON(("
+        for point in footprint :
+            footprinturl += f"{point[0]} {point[1]},"
+        footprinturl = footprinturl[:-1] + "))" # delete last coma and close parenthesis        
+    
+    query = f'filename:{filename}'
+    if footprinturl != "*":
+        query += f' AND footprint:"intersects({footprinturl})"'
+    
+    key = (url, username, query)
+    with _search_cache_lock :
+        cached = _search_cache.get(key)
+    if cached is not None and time.time() - cached[0] < cache_ttl :
+        entries = cached[1]
+    else :
+        session = http_session(n_workers)
+        auth = requests.auth.HTTPBasicAuth(username, password)
+        def request_page(start_index) :
+            params = {'start':start_index, 'rows':rows, 'q':query, 'orderby':'beginposition desc'}
+            return _search_page(url, params, session, auth, max_retries)
+        try :
+            n_prod, entries, error = request_page(0)
+            if error is None and len(entries) < n_prod :
+                with ThreadPoolExecutor(n_workers) as executor :
+                    for _, page, page_error in executor.map(request_page, range(rows, n_prod, rows)) :
+                        entries += page
+                        error = error or page_error
+        except requests.exceptions.HTTPError as e :
+            error = (e.response.status_code, e.response.reason)
+        if error is not None :
+            print(colored(f'error {error[0]} :', 'red'))
+            print(error[1])
+            return []
+        with _search_cache_lock :
+            _search_cache[key] = (time.time(), entries)
+    
+    if len(entries) == 0 : 
+        print("no product found")
+        return []
+    
+    selected_products = {}
+    for name, href, doubles in entries :
+        cloudcoverpercentage = doubles.get("mediumprobacloudpercentage", -1)
+        snowicepercentage = doubles.get("snowicepercentage", -1)
+        if snowicepercentage == 0 and cloudcoverpercentage <= max_cloudcoverpercentage :
+            selected_products[name] = href
+    
+    return selected_products
+
+def product_checksum(href, session=None, auth=None, max_retries=5):
+    """
+    (algorithm, value) of the Checksum of an OData product, href being its .../Products('uuid')/$value link.
+    None if the server doesn't give it.
+    """
+    if not href.endswith('/$value') : return None
+    try :
+        response = get_with_retry(href[:-len('/$value')], {'$format':'json'}, session=session, auth=auth, max_retries=max_retries)
+        checksum = response.json()['d']['Checksum']
+        return checksum['Algorithm'].lower(), checksum['Value'].lower()
+    except (requests.exceptions.HTTPError, ValueError, KeyError) :
+        return None
+
+def _file_digest(path, algorithm='md5', chunk_size=2**22):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as file :
+        for chunk in iter(lambda: file.read(chunk_size), b'') :
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def download_product(name, href, output_folder='Original/', session=None, auth=None, limiter=None, chunk_size=2**16,
+                     max_retries=5, backoff=1, timeout=60):
+    """
+    Download the zip of a product into output_folder/<name>.zip.
+    Data is written to <name>.zip.part, an interrupted transfer is resumed from its size with an HTTP Range request.
+    The file is checked (checksum of the server if known, then zip CRCs) before being renamed, so readers of
+    output_folder never see a partial zip. limiter (TokenBucket) gives chunks per second.
+    Output : path of the zip
+    """
+    if session is None : session = http_session()
+    path = join(output_folder, f'{name}.zip')
+    if os.path.exists(path) : return path
+    part = path + '.part'
+    checksum = product_checksum(href, session, auth, max_retries)
+    for attempt in range(max_retries + 1) :
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {'Range':f'bytes={offset}-'} if offset else {}
+        try :
+            response = get_with_retry(href, session=session, auth=auth, max_retries=max_retries, backoff=backoff,
+                                      timeout=timeout, stream=True, headers=headers)
+            if offset and response.status_code != 206 : offset = 0 # range ignored by the server : start again
+            with response, open(part, 'ab' if offset else 'wb') as file :
+                for chunk in response.iter_content(chunk_size) :
+                    if limiter is not None : limiter.acquire()
+                    file.write(chunk)
+            break
+        except requests.exceptions.HTTPError as e :
+            if e.response.status_code != 416 : raise # 416 : the part is already complete
+            break
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError) as e :
+            error = type(e).__name__
+            if attempt == max_retries : raise RuntimeError(f'{name} failed after {max_retries} retries : {error}')
+            print(colored(f'\t{name} : {error}, resume {attempt+1}/{max_retries}', 'yellow'))
+            time.sleep(backoff * 2**attempt)
+    
+    try :
+        if checksum is not None and _file_digest(part, checksum[0]) != checksum[1] :
+            raise ValueError(f'{name} : {checksum[0]} checksum mismatch')
+        with ZipFile(part) as archive :
+            bad_member = archive.testzip()
+        if bad_member is not None :
+            raise ValueError(f'{name} : corrupted member {bad_member}')
+    except (ValueError, BadZipFile) :
+        os.remove(part) # a corrupted part can't be resumed
+        raise
+    os.replace(part, path)
+    return path
+
+def scihub_credentials(username=None, password=None):
+    """
+    Username and password of the Copernicus account : the arguments, or else the environment variables
+    SCIHUB_USERNAME and SCIHUB_PASSWORD. No account is written in the code.
+    """
+    username = username or os.environ.get('SCIHUB_USERNAME')
+    password = password or os.environ.get('SCIHUB_PASSWORD')
+    if not username or not password :
+        raise ValueError("Copernicus credentials missing : pass username and password, or set SCIHUB_USERNAME and SCIHUB_PASSWORD")
+    return username, password
+
+def download_products(products, output_folder='Original/', n_workers=3, username=None, password=None,
+                      max_bytes_per_s=None, chunk_size=2**16, max_retries=5):
+    """
+    Download the products found by search_online_prod, n_workers at once, into output_folder.
+    Products already downloaded are skipped, a failing product is reported and doesn't stop the others.
+    username, password : Copernicus account, read from SCIHUB_USERNAME and SCIHUB_PASSWORD when not given (scihub_credentials).
+    max_bytes_per_s caps the total bandwidth of the workers.
+    Output : dict name -> path of the zip, or the exception raised
+    """
+    username, password = scihub_credentials(username, password)
+    os.makedirs(output_folder, exist_ok=True)
+    session = http_session(n_workers)
+    auth = requests.auth.HTTPBasicAuth(username, password)
+    limiter = TokenBucket(max_bytes_per_s/chunk_size, burst=n_workers) if max_bytes_per_s else None
+    results = {}
+    with ThreadPoolExecutor(n_workers) as executor :
+        futures = {executor.submit(download_product, name, href, output_folder, session, auth, limiter, chunk_size, max_retries):name
+                   for name, href in products.items()}
+        for future in as_completed(futures) :
+            name = futures[future]
+            try :
+                results[name] = future.result()
+                print(colored('Downloaded :', 'green'), name)
+            except Exception as e :
+                results[name] = e
+                print(colored('Download failed :', 'red'), name, repr(e))
+    return results
@@ -0,0 +1,41 @@
+import numpy as np
+from os.path import join
+from glob import iglob
+
+from .geometry import EdgeGeoCoding
+
+# =============================================================================
+# %% Snappy functions (BEAM-DIMAP products)
+# =============================================================================
+
+def read_ndwi_dim(selected_tile, product_path='NDWI/', band_name='NDWI_combined'):
+    """
+    Read the NDWI band of the .dim product written by main-NDWI for a tile (snappy : the JVM starts on the first call)
+    Output : NDWI_data -- array of shape (h, w)
+             geocoding -- EdgeGeoCoding of the product
+             corners_inbound -- array of shape (n, 2), lon, lat of the tile footprint moved 1% toward its center
+    """
+    import snappy
+    NDWI_read = None
+    for i in iglob(join(product_path, '*.dim'), recursive=True):
+        tile = i[-10:].strip('.dim')
+        if tile == selected_tile :
+            NDWI_read = snappy.ProductIO.readProduct(i)
+            break
+    assert NDWI_read is not None, f"No product match tile {selected_tile}"
+
+    band = NDWI_read.getBand(band_name)
+    w = band.getRasterWidth()
+    h = band.getRasterHeight()
+    NDWI_data = np.zeros(w * h, np.float32)
+    band.readPixels(0, 0, w, h, NDWI_data)
+    NDWI_data.shape = h, w
+
+    # you can't use linear interp with just corners : pictures are taken with straight line in x, but curved lines in angle
+    boundary = snappy.ProductUtils.createGeoBoundary(NDWI_read, 1) # coordinates given at pixels center
+    corners = np.array([np.array((x.lon, x.lat)) for x in list(snappy.ProductUtils.createGeoBoundary(NDWI_read, h//10))]) # lon, lat
+    center = np.average(corners, axis = 0)
+    corners_inbound = 99/100*corners + 1/100*center
+    geocoding = EdgeGeoCoding.from_boundary(boundary, w, h)
+    NDWI_read.dispose() # long-lived workers read many tiles
+    return NDWI_data, geocoding, corners_inbound
@@ -0,0 +1,11 @@
+import sys
+from functions.cli import main
+
+# =============================================================================
+# %% Merge tiles of a region
+# =============================================================================
+# Lakes crossing tile borders are cut in pieces by main-Polygons, the pieces are unioned here into one xml
+# Same as `python -m functions mosaic <region> [tiles]` (functions/cli.py)
+
+if __name__ == '__main__' :
+    main(['mosaic'] + sys.argv[1:])
@@ -1,28 +1,20 @@
-import gdal
-import matplotlib.colors as colors      # create visualizations
 import matplotlib.pyplot as plt         # create visualizations
 from termcolor import colored           # prints colored text
-from zipfile import ZipFile             # zip file manipulation
 from os.path import join                # data access in file manager  
-from glob import iglob                  # data access in file manager
-import pandas as pd                     # data analysis and manipulation
 import numpy as np                      # scientific computing
-import subprocess                       # external calls to system
-import snappy                           # SNAP python interface
-import jpy                              # Python-Java bridge
+import os
+import sys
 
-from PIL import Image, ImageOps
+from functions import read_zip_name, land_water_cmap, fill_hidden_pixels, composite_ndwi, gdal_strip_reader, gdal_geocoding
+from functions import EdgeGeoCoding, write_ndwi_npy, CompositeState, ProductCatalog, profiler, read_profile, write_chrome_trace
 
-import sys
-from functions import read_zip_name, output_view, output_RGB, land_water_cmap
+# Also run by `python -m functions ndwi <tile> [--engine gdal]`, which passes the tile and the engine as arguments
 
-# Change module setting
-pd.options.display.max_colwidth = 80    # Longer text in pd.df
- 
 # =============================================================================
 # %% Manual
 # =============================================================================
 
+# import subprocess
 # print(subprocess.Popen(['gpt','-h', 'Speckle-Filter'], stdout=subprocess.PIPE, universal_newlines=True).communicate()[0])
 
 # =============================================================================
@@ -31,67 +23,111 @@ pd.options.display.max_colwidth = 80    # Longer text in pd.df
 
 # Set target folder and extract metadata
 product_path = "Original/"
-input_S2_files = sorted(list(iglob(join(product_path, 'S2*_T*.zip'), recursive=True)))
 
-selected_tile = "T14UPF"
+selected_tile = sys.argv[1] if len(sys.argv) > 1 else "T14UPF"
+engine = sys.argv[2] if len(sys.argv) > 2 else 'snap' # 'snap' : SNAP Resample and BandMaths ; 'gdal' : the 4 needed rasters read from the zips with GDAL, no JVM
+
+profile_path = None # json lines file receiving the duration and memory peaks of each section, e.g. 'profile.jsonl'
+profiler.trace_memory = profile_path is not None
+profiler.start('tile', tile=selected_tile)
+profiler.start('load')
 
-Read_Products = [] # all of the products read cover the same tile
-for i in input_S2_files:
-    tile = read_zip_name(i)[5]
-    if tile == selected_tile :
-        read_zip_name(i, display = True)
-        Read_Products.append(snappy.ProductIO.readProduct(i))
+if engine == 'snap' :
+    import snappy                       # SNAP python interface
+    import jpy                          # Python-Java bridge
 
-n_prod = len(Read_Products)
+# the catalog only opens the zips added or modified since its last update
+catalog = ProductCatalog(join(product_path, 'catalog.sqlite'))
+n_indexed, n_forgotten = catalog.update(product_path)
+print(colored('Catalog updated :', 'green'), f'{n_indexed} zips indexed, {n_forgotten} forgotten')
+Selected_Files = catalog.products_for_tile(selected_tile) # all of the products read cover the same tile
+Versions = catalog.versions(Selected_Files) # mtime and size of each zip, to tell a zip replaced under the same name
+catalog.close()
+for i in Selected_Files :
+    read_zip_name(os.path.basename(i), display = True)
+
+n_prod = len(Selected_Files)
 
 print(colored('Products read :', 'green'), n_prod, colored(f'product{"s" if n_prod > 1 else ""} selected, tile', "green"), selected_tile)
 
 assert n_prod > 0, f"No product match tile {selected_tile}"
-    
+
+# with incremental compositing, the accumulators of the last run are kept in NDWI/<tile>.state,
+# only new products are read and added, products no longer selected are read and subtracted
+incremental = True
+max_tolerable_cloud_proba_percent = 20 # cloud probability above which a pixel is not used, a change combines all products again
+state_folder = f'NDWI/{selected_tile}.state'
+
+State = None
+Files_to_add, Files_to_remove = Selected_Files, []
+if incremental and os.path.exists(join(state_folder, 'manifest.json')) :
+    State = CompositeState.load(state_folder)
+    if State.max_tolerable_cloud_proba_percent != max_tolerable_cloud_proba_percent :
+        State.products = [] # everything to recombine
+    # a zip replaced under the same name is a removal plus an addition, and the replaced content can't be read any more
+    Files_changed = [i for i in State.products if i in Selected_Files and State.versions.get(i) != list(Versions[i])]
+    Files_to_add = [i for i in Selected_Files if i not in State.products]
+    Files_to_remove = [i for i in State.products if i not in Selected_Files]
+    if State.products == [] or Files_changed or any(not os.path.exists(i) for i in Files_to_remove) : # a deleted or replaced product can't be subtracted
+        print(colored('Removed products are missing or replaced, or settings changed, all products are combined again', 'yellow'))
+        State = None
+        Files_to_add, Files_to_remove = Selected_Files, []
+    else :
+        print(colored('Incremental compositing :', 'green'), f'{len(Files_to_add)} added, {len(Files_to_remove)} removed, {len(State.products) - len(Files_to_remove)} kept')
+Files_to_read = Files_to_add + Files_to_remove
+
+if engine == 'snap' :
+    Read_Products = [snappy.ProductIO.readProduct(i) for i in Files_to_read]
+
+profiler.count('products_read', len(Files_to_read))
+profiler.stop('Products loaded')
 
 # =============================================================================
 # %% Resample Product
 # =============================================================================
 # In order that all bands are of the same size
 
-parameters = snappy.HashMap()
-parameters.put('referenceBand', 'B2')
-
-Resampled_Products = []
-for product in Read_Products :
-    Resampled_Products.append(snappy.GPF.createProduct('Resample', parameters, product))
+if engine == 'snap' :
+    parameters = snappy.HashMap()
+    parameters.put('referenceBand', 'B2')
     
-print(colored('Products Resampled', 'green'))
+    Resampled_Products = []
+    for product in Read_Products :
+        Resampled_Products.append(snappy.GPF.createProduct('Resample', parameters, product))
+        
+    print(colored('Products Resampled', 'green'))
 
 # =============================================================================
 # %% NDWI (Normalized difference water index)
 # =============================================================================
 
-BandDescriptor = jpy.get_type('org.esa.snap.core.gpf.common.BandMathsOp$BandDescriptor')
-targetBand1 = BandDescriptor()
-targetBand1.name = 'NDWI'
-targetBand1.type = 'float32'
-targetBand1.expression = 'if (B3<=0 and B8<=0) then 1 else (max(0,B3) - max(0,B8))/(max(0,B3) + max(0,B8))' # there can't be negative values in original bands
-
-# mNDWI is said to be better than NDWI, however bands imply in its calculation are less precise
-# targetBand2 = BandDescriptor()
-# targetBand2.name = 'mNDWI'
-# targetBand2.type = 'float32'
-# targetBand2.expression = 'if (B3<=0 and B11<=0) then 1 else (max(0,B3) - max(0,B11))/(max(0,B3) + max(0,B11))' # there can't be negative values in original bands
-
-targetBands = jpy.array('org.esa.snap.core.gpf.common.BandMathsOp$BandDescriptor', 1)
-targetBands[0] = targetBand1
-# targetBands[1] = targetBand2
-
-parameters = snappy.HashMap()
-parameters.put('targetBands', targetBands)
-
-NDWI_Products = []
-for i, product in enumerate(Resampled_Products) :
-    print(colored(f'\tCreating NDWI band for product {i}...', 'green'))
-    NDWI_Products.append(snappy.GPF.createProduct('BandMaths', parameters, product))
-
-print(colored('NDWI bands created', 'green'))
+if engine == 'snap' :
+    BandDescriptor = jpy.get_type('org.esa.snap.core.gpf.common.BandMathsOp$BandDescriptor')
+    targetBand1 = BandDescriptor()
+    targetBand1.name = 'NDWI'
+    targetBand1.type = 'float32'
+    targetBand1.expression = 'if (B3<=0 and B8<=0) then 1 else (max(0,B3) - max(0,B8))/(max(0,B3) + max(0,B8))' # there can't be negative values in original bands
+    
+    # mNDWI is said to be better than NDWI, however bands imply in its calculation are less precise
+    # targetBand2 = BandDescriptor()
+    # targetBand2.name = 'mNDWI'
+    # targetBand2.type = 'float32'
+    # targetBand2.expression = 'if (B3<=0 and B11<=0) then 1 else (max(0,B3) - max(0,B11))/(max(0,B3) + max(0,B11))' # there can't be negative values in original bands
+    
+    targetBands = jpy.array('org.esa.snap.core.gpf.common.BandMathsOp$BandDescriptor', 1)
+    targetBands[0] = targetBand1
+    # targetBands[1] = targetBand2
+    
+    parameters = snappy.HashMap()
+    parameters.put('targetBands', targetBands)
+    
+    NDWI_Products = []
+    for i, product in enumerate(Resampled_Products) :
+        print(colored(f'\tCreating NDWI band for product {i}...', 'green'))
+        NDWI_Products.append(snappy.GPF.createProduct('BandMaths', parameters, product))
+    
+    print(colored('NDWI bands created', 'green'))
+# with the gdal engine, NDWI is computed with ndwi_formula while the products are combined
 
 # output_view(new_bands, ['NDWI','SWIR_based_NDWI'])
 
@@ -99,93 +135,63 @@ print(colored('NDWI bands created', 'green'))
 # %% Clouds handling
 # =============================================================================
 
-NDWI_Arrays = []
-Cloud_Data = []
-Cloud_Masks = []
-Known_Masks = []
-max_tolerable_cloud_proba_percent = 20
-
-for i in range(n_prod) :
-    print(colored(f'\tExtracting data from product {i}...', 'green'))
-    band_ndwi = NDWI_Products[i].getBand("NDWI")
-    band_clouds = Resampled_Products[i].getBand("quality_cloud_confidence")
-    band_classification = Resampled_Products[i].getBand("quality_scene_classification")
-    w = band_ndwi.getRasterWidth()
-    h = band_ndwi.getRasterHeight()
-    NDWI_data = np.zeros(w * h, np.float32)
-    Cloud_data = np.zeros(w * h, np.float32)
-    Classification_data = np.zeros(w * h, np.float32)
-    band_ndwi.readPixels(0, 0, w, h, NDWI_data)
-    band_clouds.readPixels(0, 0, w, h, Cloud_data)
-    band_classification.readPixels(0, 0, w, h, Classification_data)
-    NDWI_data.shape = h, w
-    Cloud_data.shape = h, w
-    Classification_data.shape = h, w
-    NDWI_Arrays.append(NDWI_data)
-    Cloud_Data.append(Cloud_data)
-    Cloud_mask = (Cloud_data > max_tolerable_cloud_proba_percent)*1 # =1 where there are too much clouds, 0 otherwise
-    Cloud_Masks.append(Cloud_mask)
-    Known_mask = (Classification_data!=0)*1 # =1 when there is data; =0 when there isn't
-    Known_Masks.append(Known_mask)
-
-Classified0_area = Known_Masks[0]
-for i in range(1, n_prod) :
-    Classified0_area = np.logical_or(Classified0_area, Known_Masks[i])
-unknown_area = np.sum(1-Classified0_area)
-if unknown_area > 0 :
-    print(colored('Warning :', 'red'), f'{unknown_area} pixels still uncovered')
-
-print(colored('NDWI, cloud and classification arrays extracted', 'green'))
+max_hidden_fraction = 0.05 # fraction of the tile always hidden above which the tile is rejected
+strip_height = 1024 # rows read at a time in each product, None to read full tiles (needs a lot of memory)
 
-Hidden_zone = Cloud_Masks[0] + np.logical_not(Known_Masks[0])*1 # 1 where the pixel is always covered by clouds or not covered at all by photography
-for i in range(1, n_prod) :
-    Hidden_zone *= (Cloud_Masks[i] + np.logical_not(Known_Masks[i]))
+profiler.start('compositing')
 
-print(colored('Remaining clouds and unknown pixels :', 'green'), f"{np.sum(Hidden_zone)}/{w*h}")
+if engine == 'snap' :
+    NDWI_Bands = [product.getBand("NDWI") for product in NDWI_Products]
+    Cloud_Bands = [product.getBand("quality_cloud_confidence") for product in Resampled_Products]
+    Classification_Bands = [product.getBand("quality_scene_classification") for product in Resampled_Products]
+    if Files_to_read :
+        w = NDWI_Bands[0].getRasterWidth()
+        h = NDWI_Bands[0].getRasterHeight()
+    
+    def read_strip(i, y0, n_rows) :
+        """
+        Read n_rows rows of product i from row y0 : NDWI, cloud confidence and scene classification
+        """
+        arrays = []
+        for band in (NDWI_Bands[i], Cloud_Bands[i], Classification_Bands[i]) :
+            data = np.zeros(w * n_rows, np.float32)
+            band.readPixels(0, y0, w, n_rows, data)
+            data.shape = n_rows, w
+            arrays.append(data)
+        return arrays
+elif Files_to_read :
+    read_strip, w, h = gdal_strip_reader(Files_to_read)
+
+if not incremental :
+    print(colored(f'\tCombining {n_prod} products by strips of {strip_height or h} rows...', 'green'))
+    NDWI_combined, Cloud_sum, Hidden_zone, Covered = composite_ndwi(read_strip, n_prod, w, h, max_tolerable_cloud_proba_percent, strip_height)
+else :
+    if State is None :
+        State = CompositeState(h, w, max_tolerable_cloud_proba_percent)
+    h, w = State.NDWI_sum.shape
+    for i, path in enumerate(Files_to_read) :
+        sign = 1 if path in Files_to_add else -1
+        print(colored(f'\t{"Adding" if sign == 1 else "Removing"} product {i} by strips of {strip_height or h} rows...', 'green'))
+        State.fold(read_strip, i, path, sign, strip_height, Versions.get(path))
+    State.save(state_folder)
+    NDWI_combined, Cloud_sum, Hidden_zone, Covered = State.result()
+
+# Hidden_zone and Covered are PackedMask : 1 bit per pixel, counted without unpacking
+unknown_area = (~Covered).count()
+if unknown_area > 0 :
+    print(colored('Warning :', 'red'), f'{unknown_area} pixels still uncovered')
 
-NDWI_sum = NDWI_Arrays[0]*0
-Cloud_sum = NDWI_Arrays[0]*0
-for i in range(n_prod) :
-    Weight_matrix = (1-np.minimum(Cloud_Data[i]/max_tolerable_cloud_proba_percent, 1))
-    NDWI_sum += NDWI_Arrays[i] * Known_Masks[i] * Weight_matrix
-    Cloud_sum += Known_Masks[i] * Weight_matrix
-NDWI_combined = np.divide(NDWI_sum, Cloud_sum, out = np.zeros(Cloud_sum.shape, dtype=float)+2, where=Cloud_sum!=0)
+print(colored('Remaining clouds and unknown pixels :', 'green'), f"{Hidden_zone.count()}/{w*h}")
 
-print(colored('NDWI arrays combined', 'green'))
+profiler.count('hidden_pixels', Hidden_zone.count())
+profiler.stop('NDWI arrays combined')
 
 # now there are 2 where there are only clouds, so we will use the pixels arounds to guess the value of NDWI (2 is an impossible value of NDWI)
-if np.sum(Hidden_zone)/(w*h) < 0.01 :
-    Coordinates_remaining_clouds = np.transpose(np.where(Cloud_sum==0))
-    NDWI_not_set=list(range(len(Coordinates_remaining_clouds)))
-    
-    x_neighbours = [0,+1,0,-1]
-    y_neighbours = [+1,0,-1,0]
-    min_neighbours = 2
-    i1 = i2 = 0
-    len0=len(NDWI_not_set)
-    while len(NDWI_not_set)>0 :
-        if i1 == len(NDWI_not_set) : 
-            i1=0 # reset loop
-            if len0 == len1 : # we check all pixels not set but we change none : we make conditions more flexible
-                min_neighbours=1
-            len0 = len1
-            
-        i2 = NDWI_not_set[i1]
-        x,y = Coordinates_remaining_clouds[i2]
-        num = div = 0
-        for j in range(4):
-            xn, yn = x+x_neighbours[j], y+y_neighbours[j]
-            if 0 <= xn < w and 0 <= yn < h and NDWI_combined[xn, yn] != 2 :
-                num += NDWI_combined[xn, yn]
-                div += 1
-        if div >= min_neighbours : 
-            NDWI_combined[x,y] = num/div
-            NDWI_not_set.pop(i1)
-        else : 
-            i1+=1
-        len1 = len(NDWI_not_set)
-        
-    print(colored('Combined array completed, remaining hidden pixels :', 'green'), np.sum(NDWI_combined==2))
+if Hidden_zone.count()/(w*h) < max_hidden_fraction :
+    profiler.start('infill')
+    NDWI_combined, n_fronts = fill_hidden_pixels(NDWI_combined, Cloud_sum==0)
+    profiler.stop()
+    print(colored('Combined array completed, remaining hidden pixels :', 'green'), np.sum(NDWI_combined==2), f'({n_fronts} fronts)')
 
 # =============================================================================
 # %% Plot bands
@@ -203,7 +209,7 @@ if np.sum(Hidden_zone)/(w*h) < 0.01 :
 # ax[1].imshow(NDWI_combined)
 # plt.show()
 
-if np.sum(Hidden_zone) > 0 :
+if Hidden_zone.any() :
     fig, ax = plt.subplots(1,2, figsize = (18,9))
     ax[0].imshow(Cloud_sum==0)
     im = ax[1].imshow(NDWI_combined, cmap = land_water_cmap(0), vmin=-1)
@@ -212,7 +218,7 @@ if np.sum(Hidden_zone) > 0 :
     ax[1].set_title(f"{selected_tile} NDWI")
     plt.show()
 
-assert np.sum(Hidden_zone)/(w*h) < 0.01, "too much unknown areas"
+assert Hidden_zone.count()/(w*h) < max_hidden_fraction, "too much unknown areas"
 
 # =============================================================================
 # %% Write output 
@@ -220,25 +226,56 @@ assert np.sum(Hidden_zone)/(w*h) < 0.01, "too much unknown areas"
 
 # we write the array as a product since we need to keep coordinates
 
-NDWI_line = np.zeros(w * h, np.float32)
-for i in range(h):
-    NDWI_line[i*w: (i+1)*w] = NDWI_combined[i]
-
-outpath_name = 'NDWI/{}.dim'.format(selected_tile)
+profiler.start('writing')
 
-targetP = snappy.Product('new_product', 'new_type', w, h)
-snappy.ProductUtils.copyMetadata(NDWI_Products[0], targetP)
-snappy.ProductUtils.copyTiePointGrids(NDWI_Products[0], targetP)
-snappy.ProductUtils.copyGeoCoding(NDWI_Products[0], targetP)
-targetP.setProductWriter(snappy.ProductIO.getProductWriter('BEAM-DIMAP'))
-targetP.setProductReader(snappy.ProductIO.getProductReader('BEAM-DIMAP'))
-snappy.ProductIO.writeProduct(targetP, outpath_name, 'BEAM-DIMAP')
+# the .dim product needs SNAP, with the gdal engine main-Polygons reads the .npy and the JVM is never started
+write_dim = engine == 'snap'
+write_npy = True
+quantize_npy = False # True : int16 instead of float32, half the file but decoded in a full copy by main-Polygons
+assert write_dim or write_npy, "nothing to write"
 
-targetB = targetP.addBand('NDWI_combined', snappy.ProductData.TYPE_FLOAT32)
-targetB.setUnit('1')
-targetP.writeHeader(outpath_name)
-targetB.writePixels(0,0,w,h,NDWI_line)
+if write_dim and (engine != 'snap' or len(Files_to_read) == 0) :
+    # SNAP is only needed here, to copy the geocoding of the first product
+    import snappy
+    NDWI_Products = [snappy.ProductIO.readProduct(Selected_Files[0])]
 
-targetP.closeIO()
-
-print(colored('Product succesfully saved in:', 'green'), outpath_name)
\ No newline at end of file
+if write_dim :
+    NDWI_line = NDWI_combined.astype(np.float32).ravel()
+    
+    outpath_name = 'NDWI/{}.dim'.format(selected_tile)
+    
+    targetP = snappy.Product('new_product', 'new_type', w, h)
+    snappy.ProductUtils.copyMetadata(NDWI_Products[0], targetP)
+    snappy.ProductUtils.copyTiePointGrids(NDWI_Products[0], targetP)
+    snappy.ProductUtils.copyGeoCoding(NDWI_Products[0], targetP)
+    targetP.setProductWriter(snappy.ProductIO.getProductWriter('BEAM-DIMAP'))
+    targetP.setProductReader(snappy.ProductIO.getProductReader('BEAM-DIMAP'))
+    snappy.ProductIO.writeProduct(targetP, outpath_name, 'BEAM-DIMAP')
+    
+    targetB = targetP.addBand('NDWI_combined', snappy.ProductData.TYPE_FLOAT32)
+    targetB.setUnit('1')
+    targetP.writeHeader(outpath_name)
+    targetB.writePixels(0,0,w,h,NDWI_line)
+    
+    targetP.closeIO()
+    
+    print(colored('Product succesfully saved in:', 'green'), outpath_name)
+
+# the same NDWI as a raw array and a json sidecar, main-Polygons opens it without JVM
+if write_npy :
+    if write_dim :
+        geocoding = EdgeGeoCoding.from_boundary(snappy.ProductUtils.createGeoBoundary(NDWI_Products[0], 1), w, h)
+        corners = np.array([np.array((x.lon, x.lat)) for x in list(snappy.ProductUtils.createGeoBoundary(NDWI_Products[0], h//10))]) # lon, lat
+    else :
+        # edges and footprint from the geotransform and projection of B3, the grid of the composite
+        geocoding, corners = gdal_geocoding(Selected_Files[0], h//10)
+    metadata = {'tile':selected_tile, 'products':[read_zip_name(i)[0:7] for i in Selected_Files]}
+    write_ndwi_npy(f'NDWI/{selected_tile}', NDWI_combined, geocoding, corners, metadata, quantize = quantize_npy)
+    print(colored('Array succesfully saved in:', 'green'), f'NDWI/{selected_tile}.npy')
+
+profiler.stop('Output written')
+profiler.stop('Tile processed')
+
+if profile_path is not None :
+    profiler.write_jsonl(profile_path)
+    write_chrome_trace(read_profile(profile_path), profile_path.rsplit('.', 1)[0] + '.trace.json') # all the runs of the profile
@@ -1,12 +1,8 @@
-import os
-from termcolor import colored           # prints colored text
-import time
-from functions import seconds_to_time
+import sys
+from functions.cli import main
 
-listdir = os.listdir('NDWI')
-list_tiles = [x.strip('.dim') for x in listdir if x.split('.')[-1] == 'dim']
-for tile in list_tiles :
-    t0 = time.time()
-    print(colored('Ongoing tile :', 'cyan'), tile )
-    os.system(f'python main-Polygons.py {tile}')
-    print(colored('Tile processed :', 'cyan'), seconds_to_time(time.time()-t0))
\ No newline at end of file
+# Run main-Polygons on all the tiles of the NDWI folder, same as `python -m functions polygons`
+# (the workers and the batch loop are in functions/batch.py)
+
+if __name__ == '__main__' :
+    main(['polygons'] + sys.argv[1:])